@@ -1,14 +1,26 @@
+import time
 import aiohttp
 import logging
 from typing import Optional, Dict, List
 from config import COURSES_API, CLASSES_API
 from utils import clean_title
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    import json
+    _json_loads = json.loads
+
 logger = logging.getLogger(__name__)
 
+# Batch content is reused this long (seconds), e.g. add batch -> first run
+CONTENT_CACHE_TTL = 60
+
 class APIClient:
     def __init__(self):
         self.session = None
+        self._content_cache = {}  # batch_id -> (expires_at, content, batch_name)
     
     async def get_session(self):
         """Get or create aiohttp session"""
@@ -27,7 +39,7 @@ class APIClient:
             session = await self.get_session()
             async with session.get(COURSES_API) as resp:
                 if resp.status == 200:
-                    data = await resp.json()
+                    data = await resp.json(loads=_json_loads)
                     batches = data.get("data", [])
                     
                     result = []
@@ -46,13 +58,19 @@ class APIClient:
     
     async def get_batch_content(self, batch_id: str) -> Optional[str]:
         """Get batch content in TXT format"""
+        cached = self._content_cache.get(batch_id)
+        if cached:
+            if cached[0] > time.monotonic():
+                return cached[1], cached[2]
+            del self._content_cache[batch_id]
+        
         try:
             session = await self.get_session()
             async with session.get(CLASSES_API.format(batch_id)) as resp:
                 if resp.status != 200:
                     return None
                 
-                data = await resp.json()
+                data = await resp.json(loads=_json_loads)
                 sections = data.get("data", {}).get("classes", [])
                 batch_name = clean_title(
                     data.get("data", {}).get("course", {}).get("title", "Batch")
@@ -95,6 +113,12 @@ class APIClient:
                         if cls.get("banner"):
                             content += f"[{topic}] BANNER: {cls.get('banner')}\n"
                 
+                # Drop expired entries so the cache only holds batches
+                # fetched within the last TTL
+                now = time.monotonic()
+                for key in [k for k, v in self._content_cache.items() if v[0] <= now]:
+                    del self._content_cache[key]
+                self._content_cache[batch_id] = (now + CONTENT_CACHE_TTL, content, batch_name)
                 return content, batch_name
                 
         except Exception as e:
@@ -4,7 +4,7 @@ from pyrogram import Client
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from database import db
 from caption_styles import CAPTION_STYLES
-from utils import extract_channel_id, format_indian_time, safe_edit, safe_reply, safe_answer, safe_send
+from utils import extract_channel_id, format_indian_time, safe_edit, safe_reply, safe_answer
 
 logger = logging.getLogger(__name__)
 
@@ -1,12 +1,9 @@
 import asyncio
 import logging
 import os
-import json
 import tempfile
 from datetime import datetime
 from database import db
-from config import ADMIN_ID, DB_PATH
-from batch_manager import BatchManager
 from utils import safe_send_document
 
 logger = logging.getLogger(__name__)
@@ -28,11 +25,11 @@ async def backup_loop(client, batch_manager):
                 logger.info("💤 No active downloads, skipping auto-backup")
                 continue
 
-            # Get unique active batch IDs
+            # Get unique active batch IDs (keys are "{batch_id}_{timestamp}")
             active_batch_ids = set()
-            for key, data in active_items.items():
-                if data.get('running') and data.get('batch_id'):
-                    active_batch_ids.add(data['batch_id'])
+            for key, running in active_items.items():
+                if running.is_set():
+                    active_batch_ids.add(key.rsplit('_', 1)[0])
 
             if not active_batch_ids:
                 continue
@@ -3,16 +3,15 @@ import logging
 import json
 from datetime import datetime, timedelta
 from pyrogram import Client
-from pyrogram.errors import FloodWait, ChatAdminRequired, ChannelPrivate
+from pyrogram.errors import ChatAdminRequired, ChannelPrivate
 from typing import Optional, Dict, List
 from database import db
 from api_client import api_client
-from utils import parse_auto_content, is_failed_url, sanitize_filename, is_youtube_url, is_mpd_url, safe_send, safe_edit, safe_reply
+from utils import parse_auto_content, is_failed_url, safe_send
 from caption_styles import apply_caption_style
-from downloader import download_video, download_image, download_document
+from downloader import download_item, item_filename
 from uploader import upload_video, upload_photo, upload_document, send_failed_link
-from video_processor import finalize_video, validate_video, get_video_duration, get_video_dimensions, generate_thumbnail
-from config import DOWNLOAD_DIR
+from video_processor import finalize_video_async, validate_video, get_video_metadata, generate_thumbnail_async, run_blocking, acquire_thumb_path, release_thumb_path
 import os
 import pytz
 
@@ -84,7 +83,7 @@ class BatchManager:
                 rows = await cursor.fetchall()
                 for row in rows:
                     url = row[0]
-                    if not is_youtube_url(url) and not is_mpd_url(url):
+                    if not is_failed_url(url):
                         failed_urls.append(url)
         
         logger.info(f"📊 {len(sent_urls)} sent, {len(failed_urls)} to retry")
@@ -97,6 +96,50 @@ class BatchManager:
         logger.info(f"🆕 {len(new_items)} new, {len(retry_items)} retry = {len(items_to_process)} total")
         return items_to_process
     
+    async def _item_progress(self, progress_chat: Optional[int], item: Dict, idx: int, total: int):
+        """Per-item progress message (None without a progress chat)"""
+        if not progress_chat:
+            return None
+        try:
+            return await safe_send(
+                self.client,
+                progress_chat,
+                f"📦 **Processing {idx}/{total}**\n\n"
+                f"📝 {item['title'][:50]}...\n"
+                f"🔄 Starting..."
+            )
+        except:
+            return None
+    
+    async def _start_download(
+        self,
+        progress_chat: Optional[int],
+        item: Dict,
+        idx: int,
+        total: int,
+        active: asyncio.Event
+    ):
+        """Post an item's progress message and start its download in the background"""
+        prog = await self._item_progress(progress_chat, item, idx, total)
+        filename = item_filename(item)
+        return prog, filename, asyncio.create_task(download_item(item, filename, prog, active))
+    
+    async def _discard_download(self, prefetched, active: asyncio.Event):
+        """Stop a prefetched download that will not be processed and remove its file"""
+        prog, _, download = prefetched
+        active.clear()
+        try:
+            path = await download
+            if path and path != 'FAILED':
+                os.remove(path)
+        except Exception:
+            pass
+        if prog:
+            try:
+                await prog.delete()
+            except:
+                pass
+    
     async def process_batch(
         self,
         batch_id: str,
@@ -153,7 +196,8 @@ class BatchManager:
             
             # Setup tracking
             download_key = f"{batch_id}_{datetime.now().timestamp()}"
-            self.active_downloads[download_key] = {'running': True, 'batch_id': batch_id}
+            self.active_downloads[download_key] = asyncio.Event()
+            self.active_downloads[download_key].set()
             self.stop_gracefully[download_key] = False
             
             # Process
@@ -164,32 +208,33 @@ class BatchManager:
             caption_style = batch['caption_style'] or 'normal'
             custom_caption = batch['custom_caption'] or ''
             
+            active = self.active_downloads[download_key]
+            
+            # (prog, filename, download task) of the next item, started as soon
+            # as the current download ends so it overlaps finalize and upload
+            prefetched = None
+            
             for idx, item in enumerate(items_to_process, 1):
                 # Check stop
                 if self.stop_gracefully.get(download_key, False):
                     logger.info(f"⏸️ Graceful stop requested")
                 
-                if not self.active_downloads[download_key]['running']:
+                if not active.is_set():
                     logger.info("⛔ Stopped")
                     break
                 
-                # Progress
-                prog = None
-                if progress_chat:
-                    try:
-                        prog = await safe_send(
-                            self.client,
-                            progress_chat,
-                            f"📦 **Processing {idx}/{len(items_to_process)}**\n\n"
-                            f"📝 {item['title'][:50]}...\n"
-                            f"🔄 Starting..."
-                        )
-                    except:
-                        pass
+                if prefetched:
+                    prog, filename, download = prefetched
+                    prefetched = None
+                else:
+                    prog = await self._item_progress(progress_chat, item, idx, len(items_to_process))
+                    filename = download = None
+                
+                thumb_path = None
                 
                 try:
                     # YouTube/MPD handling
-                    if is_youtube_url(item['url']) or is_mpd_url(item['url']):
+                    if is_failed_url(item['url']):
                         await send_failed_link(
                             self.client, destination,
                             item['title'], item['url'], idx, item['type']
@@ -201,6 +246,21 @@ class BatchManager:
                         continue
                     
                     # Download
+                    if download is None:
+                        filename = item_filename(item)
+                        download = asyncio.create_task(download_item(item, filename, prog, active))
+                    downloaded = await download
+                    
+                    # Next item downloads while this one is finalized and uploaded
+                    # (not under the same filename, which this item still uses)
+                    if (idx < len(items_to_process) and active.is_set()
+                            and not self.stop_gracefully.get(download_key, False)):
+                        next_item = items_to_process[idx]
+                        if not is_failed_url(next_item['url']) and item_filename(next_item) != filename:
+                            prefetched = await self._start_download(
+                                progress_chat, next_item, idx + 1, len(items_to_process), active
+                            )
+                    
                     file_path = None
                     download_success = False
                     
@@ -208,49 +268,56 @@ class BatchManager:
                     video_duration = 0
                     video_width = 0
                     video_height = 0
-                    thumb_path = None
 
                     if item['type'] == 'video':
-                        filename = sanitize_filename(item['title']) + '.mp4'
-                        raw_path = await download_video(
-                            item['url'], filename, prog,
-                            self.active_downloads[download_key]
-                        )
+                        raw_path = downloaded
 
                         file_path = None
                         if raw_path and raw_path != 'FAILED':
                             # PIPELINE STEP 1: Finalize (Mandatory)
                             logger.info(f"🎞️ Strict Pipeline: Finalizing {filename}...")
-                            final_path = finalize_video(raw_path)
+                            final_path = await asyncio.wrap_future(finalize_video_async(raw_path))
 
                             if final_path:
+                                # PIPELINE STEP 3 (started early): Thumbnail from FINAL file,
+                                # rendered while the file is validated and probed
+                                generated_thumb_path = acquire_thumb_path()
+                                thumb_future = generate_thumbnail_async(final_path, generated_thumb_path)
+
                                 # PIPELINE STEP 2: Validate (Mandatory)
-                                if validate_video(final_path):
+                                if await run_blocking(validate_video, final_path):
                                     file_path = final_path
 
                                     # Collect Metadata from FINAL file
-                                    video_duration = get_video_duration(final_path)
-                                    video_width, video_height = get_video_dimensions(final_path)
+                                    metadata = await run_blocking(get_video_metadata, final_path)
+                                    video_duration = metadata['duration']
+                                    video_width = metadata['width']
+                                    video_height = metadata['height']
 
-                                    # PIPELINE STEP 3: Thumbnail from FINAL file
-                                    thumb_filename = f"thumb_{idx}_{os.getpid()}.jpg"
-                                    generated_thumb_path = str(DOWNLOAD_DIR / thumb_filename)
-                                    if generate_thumbnail(final_path, generated_thumb_path, video_duration):
+                                    if await asyncio.wrap_future(thumb_future):
                                         thumb_path = generated_thumb_path
+                                    else:
+                                        release_thumb_path(generated_thumb_path)
 
                                     # Clean up raw path as we have successful final
-                                    try:
-                                        os.remove(raw_path)
-                                    except:
-                                        pass
+                                    if final_path != raw_path:
+                                        try:
+                                            os.remove(raw_path)
+                                        except:
+                                            pass
                                 else:
+                                    # Let ffmpeg finish with the file before it is removed
+                                    await asyncio.wrap_future(thumb_future)
+                                    release_thumb_path(generated_thumb_path)
+
                                     logger.warning(f"❌ Validation failed for {filename}. Fallback to Document.")
                                     item['type'] = 'document'
                                     file_path = raw_path
-                                    try:
-                                        os.remove(final_path)
-                                    except:
-                                        pass
+                                    if final_path != raw_path:
+                                        try:
+                                            os.remove(final_path)
+                                        except:
+                                            pass
                             else:
                                 logger.warning(f"❌ Finalization failed for {filename}. Fallback to Document.")
                                 item['type'] = 'document'
@@ -258,22 +325,8 @@ class BatchManager:
 
                         download_success = file_path and file_path != 'FAILED'
                     
-                    elif item['type'] == 'image':
-                        ext = os.path.splitext(item['url'])[1] or '.jpg'
-                        filename = sanitize_filename(item['title']) + ext
-                        file_path = await download_image(
-                            item['url'], filename, prog,
-                            self.active_downloads[download_key]
-                        )
-                        download_success = file_path and file_path != 'FAILED'
-                    
-                    elif item['type'] == 'document':
-                        ext = os.path.splitext(item['url'])[1] or '.pdf'
-                        filename = sanitize_filename(item['title']) + ext
-                        file_path = await download_document(
-                            item['url'], filename, prog,
-                            self.active_downloads[download_key]
-                        )
+                    else:
+                        file_path = downloaded
                         download_success = file_path and file_path != 'FAILED'
                     
                     if not download_success or not file_path:
@@ -289,7 +342,7 @@ class BatchManager:
                         
                         if self.stop_gracefully.get(download_key, False):
                             logger.info("⏸️ Stop requested, stopping now")
-                            self.active_downloads[download_key]['running'] = False
+                            self.active_downloads[download_key].clear()
                             break
                         
                         continue
@@ -332,6 +385,8 @@ class BatchManager:
                     # ✅ ONLY handle errors when they ACTUALLY occur
                     except ChatAdminRequired:
                         logger.error(f"❌ Not admin in {destination}")
+                        if prefetched:
+                            await self._discard_download(prefetched, active)
                         return {
                             'success': False,
                             'error': '❌ Bot Not Admin!',
@@ -340,6 +395,8 @@ class BatchManager:
                     
                     except ChannelPrivate:
                         logger.error(f"❌ Channel private")
+                        if prefetched:
+                            await self._discard_download(prefetched, active)
                         return {
                             'success': False,
                             'error': '❌ Channel Private!',
@@ -351,7 +408,7 @@ class BatchManager:
                     
                     if self.stop_gracefully.get(download_key, False):
                         logger.info("⏸️ Stop requested, stopping now")
-                        self.active_downloads[download_key]['running'] = False
+                        self.active_downloads[download_key].clear()
                         break
                 
                 except Exception as e:
@@ -363,8 +420,12 @@ class BatchManager:
                             await prog.delete()
                         except:
                             pass
-                
-                await asyncio.sleep(0.5)
+                finally:
+                    if thumb_path:
+                        release_thumb_path(thumb_path)
+            
+            if prefetched:
+                await self._discard_download(prefetched, active)
             
             # Cleanup
             del self.active_downloads[download_key]
@@ -641,13 +702,13 @@ class BatchManager:
         
         if graceful:
             for key in list(self.active_downloads.keys()):
-                if key.startswith(batch_id) or self.active_downloads[key].get('batch_id') == batch_id:
+                if key.startswith(batch_id):
                     self.stop_gracefully[key] = True
                     logger.info(f"⏸️ Graceful stop requested for {key}")
         else:
             for key in list(self.active_downloads.keys()):
-                if key.startswith(batch_id) or self.active_downloads[key].get('batch_id') == batch_id:
-                    self.active_downloads[key]['running'] = False
+                if key.startswith(batch_id):
+                    self.active_downloads[key].clear()
     
     async def load_all_scheduled_batches(self):
         """Load schedules on startup"""
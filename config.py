@@ -12,6 +12,7 @@ PORT = int(os.getenv("PORT", "10000"))
 DOWNLOAD_DIR = Path("downloads")
 DOWNLOAD_DIR.mkdir(exist_ok=True)
 DB_PATH = Path("bot_data.db")
+FFPATHS_CACHE = DOWNLOAD_DIR / ".ffpaths_cache.json"  # Detected ffmpeg/ffprobe paths (kept out of the repo root)
 
 # API Endpoints for Auto Mode
 COURSES_API = "https://backend.multistreaming.site/api/courses/"
@@ -44,13 +45,22 @@ MAX_RETRIES = 3
 UPLOAD_CHUNK_SIZE = 2097152  # 2MB
 TELEGRAM_FILE_LIMIT = 2000  # 2GB in MB
 SAFE_SPLIT_SIZE = 1900  # Split at 1.9GB
+FFMPEG_THREADS = int(os.getenv("FFMPEG_THREADS", "2"))  # -threads per ffmpeg job
+MAX_SPLIT_WORKERS = int(os.getenv("MAX_SPLIT_WORKERS", str(os.cpu_count() or 4)))  # Parallel ffmpeg cuts per split
+
+CHAT_SEND_RATE = 1  # Max sends per second per private chat (Telegram: ~1/s)
+GROUP_SEND_RATE = 20 / 60  # Max sends per second per group/channel (Telegram: 20/min)
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "3"))  # Max uploads in flight
+PART_UPLOAD_PARALLELISM = int(os.getenv("PART_UPLOAD_PARALLELISM", "1"))  # >1 overlaps split parts (order not kept)
 
 # Progress Settings
 PROGRESS_UPDATE_INTERVAL = 10.0
+PROGRESS_MAX_UPDATES = 20  # Target max progress edits per transfer
 
 # Thumbnail Settings
 THUMB_WIDTH = 320
 THUMB_HEIGHT = 180
+THUMB_POOL_SIZE = MAX_WORKERS * 2  # Reusable thumbnail paths
 
 # Auto Mode Settings
 DEFAULT_CHECK_INTERVAL = 3600  # 1 hour in seconds
@@ -9,10 +9,16 @@ from config import DB_PATH
 
 logger = logging.getLogger(__name__)
 
+# Delay before a session change is written to disk; later saves for the
+# same user within this window replace the pending write
+SESSION_FLUSH_DELAY = 2.0
+
 class Database:
     def __init__(self):
         self.db_path = DB_PATH
         self._init_done = False
+        self._session_cache: Dict[int, Dict] = {}
+        self._session_writes: Dict[int, asyncio.Task] = {}
     
     @asynccontextmanager
     async def get_connection(self):
@@ -86,8 +92,8 @@ class Database:
             logger.info("✅ Database initialized with status tracking")
     
     # === USER SESSION ===
-    async def save_user_session(self, user_id: int, mode: str, data: dict):
-        """Save session"""
+    async def _write_user_session(self, user_id: int, mode: str, data: dict):
+        """Write session row"""
         async with aiosqlite.connect(self.db_path) as db:
             await db.execute("""
                 INSERT OR REPLACE INTO user_sessions 
@@ -96,8 +102,45 @@ class Database:
             """, (user_id, mode, json.dumps(data), datetime.now()))
             await db.commit()
     
+    async def _delayed_session_write(self, user_id: int):
+        """Debounced background write of the cached session"""
+        try:
+            await asyncio.sleep(SESSION_FLUSH_DELAY)
+            session = self._session_cache.get(user_id)
+            if session:
+                await self._write_user_session(user_id, session['mode'], session['data'])
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Session write error: {e}")
+        finally:
+            if self._session_writes.get(user_id) is asyncio.current_task():
+                del self._session_writes[user_id]
+    
+    def _cancel_session_write(self, user_id: int):
+        """Drop pending write for user"""
+        pending = self._session_writes.pop(user_id, None)
+        if pending and not pending.done():
+            pending.cancel()
+    
+    async def save_user_session(self, user_id: int, mode: str, data: dict):
+        """Save session (cached, written to disk in background)"""
+        self._session_cache[user_id] = {'mode': mode, 'data': data}
+        self._cancel_session_write(user_id)
+        self._session_writes[user_id] = asyncio.create_task(self._delayed_session_write(user_id))
+    
+    async def flush_user_session(self, user_id: int):
+        """Write cached session to disk now"""
+        self._cancel_session_write(user_id)
+        session = self._session_cache.get(user_id)
+        if session:
+            await self._write_user_session(user_id, session['mode'], session['data'])
+    
     async def get_user_session(self, user_id: int) -> Optional[Dict]:
         """Get session"""
+        if user_id in self._session_cache:
+            return self._session_cache[user_id]
+        
         async with aiosqlite.connect(self.db_path) as db:
             async with db.execute(
                 "SELECT mode, data FROM user_sessions WHERE user_id = ?",
@@ -105,11 +148,15 @@ class Database:
             ) as cursor:
                 row = await cursor.fetchone()
                 if row:
-                    return {'mode': row[0], 'data': json.loads(row[1])}
+                    session = {'mode': row[0], 'data': json.loads(row[1])}
+                    self._session_cache[user_id] = session
+                    return session
         return None
     
     async def clear_user_session(self, user_id: int):
         """Clear session"""
+        self._cancel_session_write(user_id)
+        self._session_cache.pop(user_id, None)
         async with aiosqlite.connect(self.db_path) as db:
             await db.execute("DELETE FROM user_sessions WHERE user_id = ?", (user_id,))
             await db.commit()
@@ -6,88 +6,122 @@ import aiofiles
 import yt_dlp
 import logging
 import time
-from pathlib import Path
 from typing import Optional
 from pyrogram.types import Message
 from config import *
-from utils import format_size, format_time, create_progress_bar, is_youtube_url, is_mpd_url, safe_edit
+from utils import format_size, format_time, create_progress_bar, is_failed_url, safe_edit, sanitize_filename
 
 logger = logging.getLogger(__name__)
 
+# URL substrings that mark HLS streams ('.m3u8' covers master/index playlists)
+_STREAM_MARKERS = ('.m3u8', '.ts', '/hls/')
+
+_DIRECT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+# yt-dlp options shared by every stream download
+_YDL_BASE_OPTS = {
+    'format': 'bestvideo+bestaudio/best',
+    'merge_output_format': 'mp4',
+    'quiet': True,
+    'no_warnings': True,
+    'nocheckcertificate': True,
+    'concurrent_fragment_downloads': MAX_WORKERS,
+    'retries': MAX_RETRIES,
+    'fragment_retries': MAX_RETRIES,
+    'buffersize': CHUNK_SIZE,
+    'http_chunk_size': 10485760,
+    'hls_prefer_native': True,
+    'external_downloader': 'aria2c',
+    'external_downloader_args': ['-x', '16', '-k', '1M']
+}
+
+# Shared session for direct downloads (keep-alive across files)
+_session: Optional[aiohttp.ClientSession] = None
+
+async def get_download_session() -> aiohttp.ClientSession:
+    """Get or create the shared download session"""
+    global _session
+    if _session is None or _session.closed:
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+        
+        connector = aiohttp.TCPConnector(
+            ssl=ssl_context,
+            limit=64,
+            ttl_dns_cache=300,
+            keepalive_timeout=60
+        )
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+async def close_download_session():
+    """Close the shared download session"""
+    if _session and not _session.closed:
+        await _session.close()
+
 async def download_direct_file(
     url: str,
     output_path: str,
     progress_msg: Optional[Message],
-    active: dict
+    active: asyncio.Event
 ) -> Optional[str]:
     """
     Download direct file (images, documents, direct videos)
     """
     try:
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        
-        connector = aiohttp.TCPConnector(
-            ssl=ssl_context,
-            limit=50,
-            force_close=False
-        )
-        
+        session = await get_download_session()
         timeout = aiohttp.ClientTimeout(total=CONNECTION_TIMEOUT)
         
-        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
+        async with session.get(url, headers=_DIRECT_HEADERS, timeout=timeout) as response:
+            if response.status != 200:
+                logger.error(f"❌ HTTP {response.status} for {url}")
+                return None
+            
+            total_size = int(response.headers.get('content-length', 0))
+            downloaded = 0
+            start_time = time.time()
+            last_update_time = 0
+            
+            async with aiofiles.open(output_path, 'wb') as f:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    if not active.is_set():
+                        if os.path.exists(output_path):
+                            os.remove(output_path)
+                        logger.info("⛔ Download stopped by user")
+                        return None
+                    
+                    await f.write(chunk)
+                    downloaded += len(chunk)
+                    
+                    # Update progress
+                    now = time.time()
+                    if progress_msg and (now - last_update_time >= PROGRESS_UPDATE_INTERVAL):
+                        last_update_time = now
+                        try:
+                            percent = (downloaded / total_size * 100) if total_size > 0 else 0
+                            elapsed = now - start_time
+                            speed = downloaded / elapsed if elapsed > 0 else 0
+                            eta = int((total_size - downloaded) / speed) if speed > 0 else 0
+                            bar = create_progress_bar(percent)
+                            
+                            await safe_edit(
+                                progress_msg,
+                                f"⏬ **DOWNLOADING**\n\n"
+                                f"{bar}\n\n"
+                                f"📦 {format_size(downloaded)} / {format_size(total_size)}\n"
+                                f"🚀 {format_size(int(speed))}/s\n"
+                                f"⏱️ ETA: {format_time(eta)}"
+                            )
+                        except Exception as e:
+                            logger.debug("Progress update error: %s", e)
+            
+            if os.path.exists(output_path):
+                logger.info(f"✅ Downloaded: {format_size(downloaded)}")
+                return output_path
             
-            async with session.get(url, headers=headers) as response:
-                if response.status != 200:
-                    logger.error(f"❌ HTTP {response.status} for {url}")
-                    return None
-                
-                total_size = int(response.headers.get('content-length', 0))
-                downloaded = 0
-                start_time = time.time()
-                last_update_time = 0
-                
-                async with aiofiles.open(output_path, 'wb') as f:
-                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
-                        if not active.get('running', False):
-                            if os.path.exists(output_path):
-                                os.remove(output_path)
-                            logger.info("⛔ Download stopped by user")
-                            return None
-                        
-                        await f.write(chunk)
-                        downloaded += len(chunk)
-                        
-                        # Update progress
-                        now = time.time()
-                        if progress_msg and (now - last_update_time >= PROGRESS_UPDATE_INTERVAL):
-                            last_update_time = now
-                            try:
-                                percent = (downloaded / total_size * 100) if total_size > 0 else 0
-                                elapsed = now - start_time
-                                speed = downloaded / elapsed if elapsed > 0 else 0
-                                eta = int((total_size - downloaded) / speed) if speed > 0 else 0
-                                bar = create_progress_bar(percent)
-                                
-                                await safe_edit(
-                                    progress_msg,
-                                    f"⏬ **DOWNLOADING**\n\n"
-                                    f"{bar}\n\n"
-                                    f"📦 {format_size(downloaded)} / {format_size(total_size)}\n"
-                                    f"🚀 {format_size(int(speed))}/s\n"
-                                    f"⏱️ ETA: {format_time(eta)}"
-                                )
-                            except Exception as e:
-                                logger.debug(f"Progress update error: {e}")
-                
-                if os.path.exists(output_path):
-                    logger.info(f"✅ Downloaded: {format_size(downloaded)}")
-                    return output_path
-                
         return None
         
     except asyncio.TimeoutError:
@@ -97,19 +131,20 @@ async def download_direct_file(
         logger.error(f"❌ Download error: {e}")
         return None
 
-async def download_video_ytdlp(
+def download_video_ytdlp(
     url: str,
     output_path: str,
     progress_msg: Optional[Message],
-    active: dict,
+    active: asyncio.Event,
     download_progress: dict
 ) -> Optional[str]:
     """
     Download video using yt-dlp (for M3U8, streaming links)
+    Blocking - run in an executor thread.
     """
     try:
         def progress_hook(d):
-            if not active.get('running', False):
+            if not active.is_set():
                 raise Exception("Cancelled by user")
             
             if d['status'] == 'downloading':
@@ -128,34 +163,20 @@ async def download_video_ytdlp(
                         download_progress['speed'] = speed
                         download_progress['eta'] = eta
                 except Exception as e:
-                    logger.debug(f"Progress hook error: {e}")
+                    logger.debug("Progress hook error: %s", e)
         
         ydl_opts = {
-            'format': 'bestvideo+bestaudio/best',
+            **_YDL_BASE_OPTS,
             'outtmpl': output_path,
-            'merge_output_format': 'mp4',
-            'quiet': True,
-            'no_warnings': True,
-            'nocheckcertificate': True,
-            'concurrent_fragment_downloads': MAX_WORKERS,
-            'retries': MAX_RETRIES,
-            'fragment_retries': MAX_RETRIES,
-            'buffersize': CHUNK_SIZE,
-            'http_chunk_size': 10485760,
-            'hls_prefer_native': True,
-            'progress_hooks': [progress_hook],
-            'external_downloader': 'aria2c',
-            'external_downloader_args': ['-x', '16', '-k', '1M']
+            'progress_hooks': [progress_hook]
         }
         
         logger.info(f"🎬 Starting yt-dlp download...")
         
+        # Returns once the download (and merge) has finished writing
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             ydl.download([url])
         
-        # Wait for file to be fully written
-        await asyncio.sleep(2)
-        
         # Find output file
         if os.path.exists(output_path):
             logger.info(f"✅ yt-dlp download complete: {output_path}")
@@ -186,7 +207,7 @@ async def download_video_ytdlp(
 async def update_video_progress(
     progress_msg: Optional[Message],
     download_progress: dict,
-    active: dict
+    active: asyncio.Event
 ):
     """Update video download progress"""
     if not progress_msg:
@@ -194,7 +215,7 @@ async def update_video_progress(
     
     last_update_time = 0
     
-    while active.get('running', False):
+    while active.is_set():
         try:
             now = time.time()
             if not download_progress or now - last_update_time < PROGRESS_UPDATE_INTERVAL:
@@ -219,7 +240,7 @@ async def update_video_progress(
                 f"⏱️ ETA: {format_time(int(eta))}"
             )
         except Exception as e:
-            logger.debug(f"Progress update error: {e}")
+            logger.debug("Progress update error: %s", e)
         
         await asyncio.sleep(1)
 
@@ -227,7 +248,7 @@ async def download_video(
     url: str,
     filename: str,
     progress_msg: Optional[Message],
-    active: dict
+    active: asyncio.Event
 ) -> Optional[str]:
     """
     Main video download function
@@ -237,13 +258,13 @@ async def download_video(
     
     try:
         # Check if failed URL (YouTube, MPD)
-        if is_youtube_url(url) or is_mpd_url(url):
+        if is_failed_url(url):
             logger.info("❌ Failed URL detected (YouTube/MPD)")
             return 'FAILED'
         
         # Detect if streaming or direct
         url_lower = url.lower()
-        is_stream = any(x in url_lower for x in ['.m3u8', '.ts', '/hls/', 'master.m3u8', 'index.m3u8'])
+        is_stream = any(x in url_lower for x in _STREAM_MARKERS)
         
         if is_stream:
             logger.info("📺 Streaming video detected (M3U8/HLS)")
@@ -256,12 +277,11 @@ async def download_video(
                 )
             
             # Download in executor to avoid blocking
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
             result = await loop.run_in_executor(
                 None,
-                lambda: asyncio.run(download_video_ytdlp(
-                    url, output_path, progress_msg, active, download_progress
-                ))
+                download_video_ytdlp,
+                url, output_path, progress_msg, active, download_progress
             )
             
             if progress_msg:
@@ -283,7 +303,7 @@ async def download_image(
     url: str,
     filename: str,
     progress_msg: Optional[Message],
-    active: dict
+    active: asyncio.Event
 ) -> Optional[str]:
     """Download image"""
     output_path = str(DOWNLOAD_DIR / filename)
@@ -294,9 +314,34 @@ async def download_document(
     url: str,
     filename: str,
     progress_msg: Optional[Message],
-    active: dict
+    active: asyncio.Event
 ) -> Optional[str]:
     """Download document"""
     output_path = str(DOWNLOAD_DIR / filename)
     logger.info(f"📄 Downloading document: {filename}")
     return await download_direct_file(url, output_path, progress_msg, active)
+
+def item_filename(item: dict) -> str:
+    """Download filename for a parsed content item"""
+    if item['type'] == 'video':
+        ext = '.mp4'
+    elif item['type'] == 'image':
+        ext = os.path.splitext(item['url'])[1] or '.jpg'
+    else:
+        ext = os.path.splitext(item['url'])[1] or '.pdf'
+    return sanitize_filename(item['title']) + ext
+
+async def download_item(
+    item: dict,
+    filename: str,
+    progress_msg: Optional[Message],
+    active: asyncio.Event
+) -> Optional[str]:
+    """Download a parsed content item with the downloader for its type"""
+    if item['type'] == 'video':
+        return await download_video(item['url'], filename, progress_msg, active)
+    if item['type'] == 'image':
+        return await download_image(item['url'], filename, progress_msg, active)
+    if item['type'] == 'document':
+        return await download_document(item['url'], filename, progress_msg, active)
+    return None
@@ -7,8 +7,10 @@ from config import *
 from database import db
 from api_client import api_client
 from batch_manager import BatchManager
-from utils import safe_reply, safe_edit, safe_answer
+from utils import safe_reply, safe_edit
 from backup_manager import backup_loop
+from video_processor import cleanup_thumb_pool
+from downloader import close_download_session
 import manual_mode
 import auto_mode
 
@@ -75,7 +77,7 @@ async def id_handler(client: Client, message: Message):
 async def stop_handler(client: Client, message: Message):
     user_id = message.from_user.id
     if user_id in manual_mode.active_downloads:
-        manual_mode.active_downloads[user_id]['running'] = False
+        manual_mode.active_downloads[user_id].clear()
         await safe_reply(message, "⛔ Stopped!")
     else:
         await safe_reply(message, "💤 No active downloads")
@@ -330,6 +332,8 @@ async def main():
         try:
             await app.stop()
             await api_client.close()
+            await close_download_session()
+            cleanup_thumb_pool()
         except:
             pass
 
@@ -1,18 +1,26 @@
 import os
+import re
 import asyncio
 import logging
-from pyrogram import Client, filters
+from pathlib import Path
+from pyrogram import Client
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from config import DOWNLOAD_DIR, QUALITY_PRESETS
 from database import db
 from utils import parse_txt_content, count_content_types, is_failed_url, safe_reply, safe_edit, safe_answer
-from downloader import download_video, download_image, download_document
+from downloader import download_item, item_filename
 from uploader import upload_video, upload_photo, upload_document, send_failed_link
-from video_processor import finalize_video, validate_video, get_video_duration, get_video_dimensions, generate_thumbnail
+from video_processor import finalize_video_async, validate_video, get_video_metadata, generate_thumbnail_async, run_blocking, acquire_thumb_path, release_thumb_path
 
 logger = logging.getLogger(__name__)
 
-# Active downloads tracking
+# Range input: "5" or "1-50"
+_RANGE_RE = re.compile(r'^\s*(\d+)(?:\s*-\s*(\d+))?\s*$')
+
+# Quality callback data -> quality key
+_QUALITY_CALLBACKS = {f"quality_{key}": key for key in QUALITY_PRESETS}
+
+# Active downloads tracking (user_id -> Event, set while running)
 active_downloads = {}
 
 async def start_manual_mode(client: Client, message: Message):
@@ -47,15 +55,14 @@ async def handle_txt_file(client: Client, message: Message):
         )
         
         # Read content
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        content = await asyncio.to_thread(Path(file_path).read_text, encoding='utf-8')
         
         # Parse content
         items = parse_txt_content(content)
         
         if not items:
             await safe_edit(status, "❌ No valid links found!")
-            os.remove(file_path)
+            await asyncio.to_thread(os.remove, file_path)
             return
         
         # Count types
@@ -151,56 +158,62 @@ async def handle_range_input(client: Client, message: Message):
     items = session['data']['items']
     text = message.text.strip()
     
-    try:
-        if '-' in text:
-            start, end = map(int, text.split('-'))
-        else:
-            start = end = int(text)
-        
-        if start < 1 or end > len(items) or start > end:
-            await safe_reply(message, f"❌ Invalid range! Use 1-{len(items)}")
-            return
-        
-        session['data']['range'] = (start, end)
-        session['data']['step'] = 'select_quality'
-        await db.save_user_session(user_id, 'manual', session['data'])
-        
-        kb = InlineKeyboardMarkup([
-            [
-                InlineKeyboardButton("480p", callback_data="quality_480p"),
-                InlineKeyboardButton("720p", callback_data="quality_720p")
-            ],
-            [InlineKeyboardButton("1080p (Original)", callback_data="quality_1080p")],
-            [InlineKeyboardButton("🔙 Back", callback_data="back_to_range")]
-        ])
-        
-        count = end - start + 1
-        await safe_reply(
-            message,
-            f"📊 **Range: {start}-{end}** ({count} items)\n\n"
-            f"🎬 **Select Quality:**\n\n"
-            f"💡 1080p downloads original quality without conversion",
-            reply_markup=kb
-        )
-        
-    except:
+    match = _RANGE_RE.match(text)
+    if not match:
         await safe_reply(message, "❌ Invalid format! Use: `1-10` or `5`")
+        return
+    
+    start = int(match.group(1))
+    end = int(match.group(2) or match.group(1))
+    
+    if start < 1 or end > len(items) or start > end:
+        await safe_reply(message, f"❌ Invalid range! Use 1-{len(items)}")
+        return
+    
+    session['data']['range'] = (start, end)
+    session['data']['step'] = 'select_quality'
+    await db.save_user_session(user_id, 'manual', session['data'])
+    
+    kb = InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("480p", callback_data="quality_480p"),
+            InlineKeyboardButton("720p", callback_data="quality_720p")
+        ],
+        [InlineKeyboardButton("1080p (Original)", callback_data="quality_1080p")],
+        [InlineKeyboardButton("🔙 Back", callback_data="back_to_range")]
+    ])
+    
+    count = end - start + 1
+    await safe_reply(
+        message,
+        f"📊 **Range: {start}-{end}** ({count} items)\n\n"
+        f"🎬 **Select Quality:**\n\n"
+        f"💡 1080p downloads original quality without conversion",
+        reply_markup=kb
+    )
 
 async def handle_quality_selection(client: Client, callback: CallbackQuery):
     """Handle quality selection and start processing"""
     user_id = callback.from_user.id
-    quality = callback.data.split("_")[1]
+    quality = _QUALITY_CALLBACKS.get(callback.data)
+    if not quality:
+        await safe_answer(callback, "❌ Invalid quality!", show_alert=True)
+        return
     
     session = await db.get_user_session(user_id)
     if not session:
         await safe_answer(callback, "❌ Session expired!", show_alert=True)
         return
     
+    # Terminal setup step - persist session before the long-running batch
+    await db.flush_user_session(user_id)
+    
     items = session['data']['items']
     start, end = session['data']['range']
     selected_items = items[start-1:end]
     
-    active_downloads[user_id] = {'running': True}
+    active_downloads[user_id] = asyncio.Event()
+    active_downloads[user_id].set()
     
     kb = InlineKeyboardMarkup([
         [InlineKeyboardButton("⛔ Stop", callback_data="stop_download")]
@@ -227,6 +240,36 @@ async def handle_quality_selection(client: Client, callback: CallbackQuery):
     await db.clear_user_session(user_id)
     active_downloads.pop(user_id, None)
 
+async def _item_progress(message: Message, item: dict, idx: int, end: int) -> Message:
+    """Per-item progress message"""
+    return await safe_reply(
+        message,
+        f"📦 **Item {idx}/{end}**\n"
+        f"📝 {item['title'][:50]}...\n"
+        f"🚀 Processing..."
+    )
+
+async def _start_download(message: Message, item: dict, idx: int, end: int, active: asyncio.Event):
+    """Post an item's progress message and start its download in the background"""
+    prog = await _item_progress(message, item, idx, end)
+    filename = item_filename(item)
+    return prog, filename, asyncio.create_task(download_item(item, filename, prog, active))
+
+async def _discard_download(prefetched, active: asyncio.Event):
+    """Stop a prefetched download that will not be processed and remove its file"""
+    prog, _, download = prefetched
+    active.clear()
+    try:
+        path = await download
+        if path and path != 'FAILED':
+            os.remove(path)
+    except Exception:
+        pass
+    try:
+        await prog.delete()
+    except:
+        pass
+
 async def process_items(
     client: Client,
     message: Message,
@@ -239,18 +282,25 @@ async def process_items(
     """Process and upload items"""
     success = 0
     failed = 0
+    active = active_downloads.get(user_id)
+    
+    # (prog, filename, download task) of the next item, started as soon
+    # as the current download ends so it overlaps finalize and upload
+    prefetched = None
     
     for idx, item in enumerate(items, start):
-        if not active_downloads.get(user_id, {}).get('running', False):
+        if not active or not active.is_set():
             await safe_reply(message, "⛔ **STOPPED BY USER**")
             break
         
-        prog = await safe_reply(
-            message,
-            f"📦 **Item {idx}/{end}**\n"
-            f"📝 {item['title'][:50]}...\n"
-            f"🚀 Processing..."
-        )
+        if prefetched:
+            prog, filename, download = prefetched
+            prefetched = None
+        else:
+            prog = await _item_progress(message, item, idx, end)
+            filename = download = None
+        
+        thumb_path = None
         
         try:
             # Check if failed URL
@@ -264,51 +314,72 @@ async def process_items(
                 continue
             
             # Download
+            if download is None:
+                filename = item_filename(item)
+                download = asyncio.create_task(download_item(item, filename, prog, active))
+            downloaded = await download
+            
+            # Next item downloads while this one is finalized and uploaded
+            # (not under the same filename, which this item still uses)
+            next_pos = idx - start + 1
+            if next_pos < len(items) and active.is_set():
+                next_item = items[next_pos]
+                if not is_failed_url(next_item['url']) and item_filename(next_item) != filename:
+                    prefetched = await _start_download(message, next_item, idx + 1, end, active)
+            
             file_path = None
 
             # STRICT PIPELINE VARIABLES
             video_duration = 0
             video_width = 0
             video_height = 0
-            thumb_path = None
 
             if item['type'] == 'video':
-                filename = sanitize_filename(item['title']) + '.mp4'
-                raw_path = await download_video(
-                    item['url'], filename, prog, active_downloads[user_id]
-                )
+                raw_path = downloaded
 
                 if raw_path and raw_path != 'FAILED':
                      # PIPELINE STEP 1: Finalize (Mandatory)
-                    final_path = finalize_video(raw_path)
+                    final_path = await asyncio.wrap_future(finalize_video_async(raw_path))
 
                     if final_path:
+                        # PIPELINE STEP 3 (started early): Thumbnail from FINAL file,
+                        # rendered while the file is validated and probed
+                        generated_thumb_path = acquire_thumb_path()
+                        thumb_future = generate_thumbnail_async(final_path, generated_thumb_path)
+
                         # PIPELINE STEP 2: Validate (Mandatory)
-                        if validate_video(final_path):
+                        if await run_blocking(validate_video, final_path):
                             file_path = final_path
 
                             # Collect Metadata from FINAL file
-                            video_duration = get_video_duration(final_path)
-                            video_width, video_height = get_video_dimensions(final_path)
+                            metadata = await run_blocking(get_video_metadata, final_path)
+                            video_duration = metadata['duration']
+                            video_width = metadata['width']
+                            video_height = metadata['height']
 
-                            # PIPELINE STEP 3: Thumbnail from FINAL file
-                            thumb_filename = f"thumb_{idx}_{os.getpid()}.jpg"
-                            generated_thumb_path = str(DOWNLOAD_DIR / thumb_filename)
-                            if generate_thumbnail(final_path, generated_thumb_path, video_duration):
+                            if await asyncio.wrap_future(thumb_future):
                                 thumb_path = generated_thumb_path
+                            else:
+                                release_thumb_path(generated_thumb_path)
 
-                            try:
-                                os.remove(raw_path)
-                            except:
-                                pass
+                            if final_path != raw_path:
+                                try:
+                                    os.remove(raw_path)
+                                except:
+                                    pass
                         else:
+                            # Let ffmpeg finish with the file before it is removed
+                            await asyncio.wrap_future(thumb_future)
+                            release_thumb_path(generated_thumb_path)
+
                             logger.warning("❌ Validation failed. Fallback to Document.")
                             item['type'] = 'document'
                             file_path = raw_path
-                            try:
-                                os.remove(final_path)
-                            except:
-                                pass
+                            if final_path != raw_path:
+                                try:
+                                    os.remove(final_path)
+                                except:
+                                    pass
                     else:
                         logger.warning("❌ Finalization failed. Fallback to Document.")
                         item['type'] = 'document'
@@ -316,18 +387,8 @@ async def process_items(
                 else:
                     file_path = raw_path
 
-            elif item['type'] == 'image':
-                ext = os.path.splitext(item['url'])[1] or '.jpg'
-                filename = sanitize_filename(item['title']) + ext
-                file_path = await download_image(
-                    item['url'], filename, prog, active_downloads[user_id]
-                )
-            elif item['type'] == 'document':
-                ext = os.path.splitext(item['url'])[1] or '.pdf'
-                filename = sanitize_filename(item['title']) + ext
-                file_path = await download_document(
-                    item['url'], filename, prog, active_downloads[user_id]
-                )
+            else:
+                file_path = downloaded
             
             if file_path == 'FAILED':
                 await send_failed_link(
@@ -382,8 +443,12 @@ async def process_items(
                 await prog.delete()
             except:
                 pass
-        
-        await asyncio.sleep(0.3)
+        finally:
+            if thumb_path:
+                release_thumb_path(thumb_path)
+    
+    if prefetched:
+        await _discard_download(prefetched, active)
     
     await safe_reply(
         message,
@@ -398,5 +463,5 @@ async def stop_download(client: Client, callback: CallbackQuery):
     """Stop download"""
     user_id = callback.from_user.id
     if user_id in active_downloads:
-        active_downloads[user_id]['running'] = False
+        active_downloads[user_id].clear()
     await safe_answer(callback, "⛔ Stopping...", show_alert=True)
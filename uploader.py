@@ -1,64 +1,347 @@
+import io
 import os
 import asyncio
+import aiofiles.os
+import contextlib
 import logging
+import mimetypes
 import time
-from pathlib import Path
-from typing import Optional, List, Union
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union
 from pyrogram import Client
 from pyrogram.types import Message
 from pyrogram.errors import FloodWait
-from utils import format_size, format_time, create_progress_bar, safe_edit, safe_send
-from video_processor import split_video_file, get_video_metadata, generate_thumbnail
-from config import UPLOAD_CHUNK_SIZE, SAFE_SPLIT_SIZE, DOWNLOAD_DIR, PROGRESS_UPDATE_INTERVAL
+from utils import format_size, format_time, create_progress_bar, safe_edit, safe_send, RateLimiter
+from video_processor import split_video_file, plan_video_split, SegmentSplit, video_part_path, extract_video_part, get_video_metadata, get_video_duration, generate_thumbnail, run_blocking, acquire_thumb_path, release_thumb_path
+from config import SAFE_SPLIT_SIZE, MAX_SPLIT_WORKERS, PROGRESS_MAX_UPDATES, CHAT_SEND_RATE, GROUP_SEND_RATE, UPLOAD_CONCURRENCY, PART_UPLOAD_PARALLELISM
 
 logger = logging.getLogger(__name__)
 
+SAFE_SPLIT_BYTES = int(SAFE_SPLIT_SIZE * 1024 * 1024)
+
+# generate_thumbnail grabs the frame at 00:00:03; a part starting before
+# that point shows the same frame as the source thumbnail
+THUMB_SEEK_SECONDS = 3
+
+# Failed-link emoji per content type
+_TYPE_EMOJI = {
+    'video': '🎬',
+    'image': '🖼️',
+    'document': '📄'
+}
+
+class _ChatLimiters(dict):
+    """Per-chat send limiters; groups and channels (negative ids) get the lower rate"""
+    
+    def __missing__(self, chat_id: int) -> RateLimiter:
+        limiter = self[chat_id] = RateLimiter(GROUP_SEND_RATE if chat_id < 0 else CHAT_SEND_RATE)
+        return limiter
+
+_chat_limiters = _ChatLimiters()
+
+# Per-chat ordering and global cap on uploads in flight
+_chat_locks = defaultdict(asyncio.Lock)
+_upload_sem = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+async def _limited_send(send_func, chat_id: int, ordered: bool = True, **kwargs):
+    """
+    Call a client.send_* method through the chat's rate limiter.
+    Ordered sends to one chat go out one at a time, in order; at most
+    UPLOAD_CONCURRENCY uploads run at once across all chats.
+    On FloodWait, sleeps the requested time and retries once.
+    """
+    async with _chat_locks[chat_id] if ordered else contextlib.nullcontext():
+        for attempt in range(2):
+            try:
+                async with _upload_sem, _chat_limiters[chat_id]:
+                    return await send_func(chat_id=chat_id, **kwargs)
+            except FloodWait as e:
+                if attempt:
+                    raise
+                logger.warning(f"⏱️ FloodWait: {e.value}s, retrying")
+                await asyncio.sleep(e.value)
+
+def _throttle_interval(total: int) -> float:
+    """Base progress-edit interval by transfer size"""
+    if total < 50 * 1024 * 1024:
+        return 0.5
+    if total < 500 * 1024 * 1024:
+        return 1.0
+    return 2.5
+
+_PROGRESS_TEMPLATE = (
+    "📤 **UPLOADING**\n\n"
+    "{part}{bar}\n\n"
+    "📦 {cur} / {tot}\n"
+    "🚀 {spd}/s\n"
+    "⏱️ ETA: {eta}"
+)
+
 class UploadProgressTracker:
-    def __init__(self, progress_msg: Message, part_num: int = 0, total_parts: int = 1):
+    def __init__(self, progress_msg: Message, part_num: int = 0, total_parts: int = 1, total_size_hint: int = 0):
         self.progress_msg = progress_msg
         self.part_num = part_num
         self.total_parts = total_parts
-        self.last_update = 0
-        self.start_time = time.time()
-        self.speeds = []
+        self.last_update = time.time()
+        self.last_percent = 0
+        self.blocked_until = 0.0
+        self.base_interval = _throttle_interval(total_size_hint) if total_size_hint else None
+        self.interval = self.base_interval or 0
+        self.last_text_hash = None
+        self.last_bytes = 0
+        self.avg_speed = 0.0
+        self._part_prefix = f"📊 Part {part_num}/{total_parts}\n" if total_parts > 1 else ""
+        self._total = None
+        self._total_str = ""
     
     async def progress_callback(self, current: int, total: int):
+        final = current >= total > 0  # Always show completion
+        
+        percent_step = current * 100 // total if total > 0 else 0
+        if not final and percent_step == self.last_percent:  # No visible change
+            return
+        
+        now = time.time()
+        if now < self.blocked_until:  # Edits are flood-limited
+            return
+        
+        if self.base_interval is None:
+            self.base_interval = self.interval = _throttle_interval(total)
+        
+        if not final and now - self.last_update < self.interval:  # Strict throttle
+            return
+        
+        self.last_percent = percent_step
+        
         try:
-            now = time.time()
+            # Exponential moving average of the speed since the last edit
+            elapsed = now - self.last_update
+            if elapsed > 0:
+                inst = (current - self.last_bytes) / elapsed
+                self.avg_speed = 0.3 * inst + 0.7 * self.avg_speed if self.avg_speed else inst
+            self.last_update = now
+            self.last_bytes = current
             
-            if now - self.last_update < PROGRESS_UPDATE_INTERVAL:  # Strict throttle
-                return
+            avg_speed = self.avg_speed
+            eta = int((total - current) / avg_speed) if avg_speed > 0 else 0
             
-            self.last_update = now
+            # Size-aware throttle: about PROGRESS_MAX_UPDATES edits per upload
+            self.interval = max(
+                self.base_interval,
+                total / max(avg_speed, 1) / PROGRESS_MAX_UPDATES
+            )
             
-            percent = (current / total) * 100 if total > 0 else 0
-            elapsed = now - self.start_time
-            speed = current / elapsed if elapsed > 0 else 0
+            if total != self._total:
+                self._total = total
+                self._total_str = format_size(total)
             
-            self.speeds.append(speed)
-            if len(self.speeds) > 5:
-                self.speeds.pop(0)
+            text = _PROGRESS_TEMPLATE.format_map({
+                'part': self._part_prefix,
+                'bar': create_progress_bar(current * 100 / total if total > 0 else 0),
+                'cur': format_size(current),
+                'tot': self._total_str,
+                'spd': format_size(int(avg_speed)),
+                'eta': format_time(eta)
+            })
             
-            avg_speed = sum(self.speeds) / len(self.speeds)
-            eta = int((total - current) / avg_speed) if avg_speed > 0 else 0
+            text_hash = hash(text)
+            if text_hash == self.last_text_hash:  # Telegram rejects identical edits
+                return
+            self.last_text_hash = text_hash
             
-            bar = create_progress_bar(percent)
+            # Not safe_edit: sleeping out a FloodWait here would stall the upload
+            await self.progress_msg.edit_text(text)
+        except FloodWait as e:
+            self.blocked_until = time.time() + e.value
+        except Exception as e:
+            logger.debug("Progress update error: %s", e)
+
+async def _prepare_part(
+    part_path: str,
+    base_meta: Optional[dict] = None,
+    base_thumb: Optional[str] = None,
+    planned_duration: float = 0,
+    start_offset: float = 0
+):
+    """
+    Metadata and thumbnail for a part.
+    With base_meta (split parts), only the part duration is probed; width
+    and height are shared with the source. A part starting before the
+    thumbnail seek point reuses base_thumb.
+    Returns (metadata, thumb_path) - (None, None) if the part is missing.
+    A returned thumb_path other than base_thumb comes from the pool and
+    must be released.
+    """
+    if not await aiofiles.os.path.exists(part_path):
+        return None, None
+    
+    if base_meta:
+        duration = await run_blocking(get_video_duration, part_path) or int(planned_duration)
+        metadata = {**base_meta, 'duration': duration}
+    else:
+        metadata = await run_blocking(get_video_metadata, part_path)
+    
+    if base_thumb and start_offset < THUMB_SEEK_SECONDS:
+        return metadata, base_thumb
+    
+    thumb_path = acquire_thumb_path()
+    if await run_blocking(generate_thumbnail, part_path, thumb_path, metadata['duration']):
+        return metadata, thumb_path
+    
+    release_thumb_path(thumb_path)
+    return metadata, base_thumb
+
+def _discard_part(part, base_thumb: Optional[str] = None):
+    """Remove a produced part that will not be uploaded, and its thumbnail"""
+    part_path, _, thumb_path, _ = part
+    if thumb_path and thumb_path != base_thumb:
+        release_thumb_path(thumb_path)
+    with contextlib.suppress(OSError):
+        os.remove(part_path)
+
+async def _put_part(queue: asyncio.Queue, part, base_thumb: Optional[str] = None):
+    """Queue a part; if cancelled before it is queued, drop its thumbnail"""
+    try:
+        await queue.put(part)
+    except BaseException:
+        if part[2] and part[2] != base_thumb:
+            release_thumb_path(part[2])
+        raise
+
+async def _produce_video_parts(
+    video_path: str,
+    plan,
+    queue: asyncio.Queue,
+    base_thumb: Optional[str] = None
+) -> bool:
+    """
+    Split producer: queues segment muxer output as it is written, cuts
+    whatever that could not produce part by part, and queues
+    (part_path, metadata, thumb_path, total_parts) in order; None marks
+    the end.
+    Without a plan, the original file is queued as the only part.
+    Returns True if every part was produced.
+    """
+    complete = False
+    try:
+        if not plan:
+            if base_thumb:
+                # Thumbnail of this very file - no need to regenerate
+                metadata = await run_blocking(get_video_metadata, video_path)
+                thumb_path = base_thumb
+            else:
+                metadata, thumb_path = await _prepare_part(video_path)
+            if metadata:
+                await queue.put((video_path, metadata, thumb_path, 1))
+            complete = True
+        else:
+            num_parts, part_duration = plan
+            # Probed once (cached by plan_video_split); parts share it
+            base_meta = await run_blocking(get_video_metadata, video_path)
             
-            part_info = ""
-            if self.total_parts > 1:
-                part_info = f"📊 Part {self.part_num}/{self.total_parts}\n"
+            produced = 0
+            # Part taken from a split but not yet queued; removed if the
+            # producer stops before handing it over
+            pending = None
             
-            await safe_edit(
-                self.progress_msg,
-                f"📤 **UPLOADING**\n\n"
-                f"{part_info}"
-                f"{bar}\n\n"
-                f"📦 {format_size(current)} / {format_size(total)}\n"
-                f"🚀 {format_size(int(avg_speed))}/s\n"
-                f"⏱️ ETA: {format_time(eta)}"
-            )
-        except:
-            pass
+            # One ffmpeg pass; each segment is queued as soon as ffmpeg
+            # closes it. While the queue is full ffmpeg is paused, so no
+            # more than the queue depth waits on disk. Segments are cut on
+            # keyframes: the caption total is the planned count unless
+            # more segments come out.
+            split = await run_blocking(SegmentSplit, video_path, part_duration)
+            segments_done = False
+            try:
+                while True:
+                    segment = await run_blocking(split.next_segment)
+                    if segment is None:
+                        segments_done = produced > 0
+                        break
+                    seg_path, start_offset = segment
+                    if os.path.getsize(seg_path) > SAFE_SPLIT_BYTES:
+                        logger.warning(f"⚠️ Segment {produced+1} over the size limit, cutting the rest per part")
+                        break
+                    
+                    num_parts = max(num_parts, produced + 1)
+                    pending = video_part_path(video_path, produced, num_parts)
+                    await aiofiles.os.replace(seg_path, pending)
+                    metadata, thumb_path = await _prepare_part(
+                        pending, base_meta, base_thumb, part_duration, start_offset
+                    )
+                    if queue.full():
+                        split.pause()
+                    await _put_part(queue, (pending, metadata, thumb_path, num_parts), base_thumb)
+                    split.resume()
+                    pending = None
+                    produced += 1
+            except Exception as e:
+                logger.warning(f"⚠️ Segment split error: {e}, cutting the rest per part")
+            finally:
+                await run_blocking(split.close)
+                if pending:
+                    with contextlib.suppress(OSError):
+                        await aiofiles.os.remove(pending)
+            
+            if segments_done:
+                complete = True
+            elif produced >= num_parts:
+                logger.error(f"❌ Split failed after part {produced}/{num_parts}")
+            else:
+                # Stream-copy cuts for the parts the segment pass did not
+                # produce. I/O bound, so several run at once, but never more
+                # than the queue depth ahead of the uploader. Own pool, so
+                # cuts don't hold up probes/thumbnails in FFMPEG_EXECUTOR
+                loop = asyncio.get_running_loop()
+                depth = max(1, queue.maxsize)
+                cut_pool = ThreadPoolExecutor(max_workers=max(1, min(depth, MAX_SPLIT_WORKERS)))
+                cuts = {}
+                try:
+                    for i in range(produced, num_parts):
+                        for j in range(i, min(i + depth, num_parts)):
+                            if j not in cuts:
+                                cuts[j] = loop.run_in_executor(
+                                    cut_pool, extract_video_part, video_path, j, num_parts, part_duration
+                                )
+                        
+                        # Shielded: if the producer is cancelled, the running
+                        # cut is still awaited below and its file removed
+                        part_path = await asyncio.shield(cuts[i])
+                        if not part_path:
+                            logger.error(f"❌ Split failed at part {i+1}/{num_parts}")
+                            break
+                        del cuts[i]
+                        pending = part_path
+                        
+                        metadata, thumb_path = await _prepare_part(
+                            part_path, base_meta, base_thumb, part_duration, i * part_duration
+                        )
+                        await _put_part(queue, (part_path, metadata, thumb_path, num_parts), base_thumb)
+                        pending = None
+                    else:
+                        complete = True
+                finally:
+                    # Cuts not handed to the uploader: cancel those not
+                    # started, wait for running ones and remove their files
+                    cut_pool.shutdown(wait=False, cancel_futures=True)
+                    leftovers = await asyncio.gather(*cuts.values(), return_exceptions=True)
+                    for part_path in [*leftovers, pending]:
+                        if isinstance(part_path, str):
+                            with contextlib.suppress(OSError):
+                                await aiofiles.os.remove(part_path)
+            
+            if complete:
+                # Every part exists and is self-contained; the original is
+                # no longer needed. On a failed cut it is kept.
+                try:
+                    await aiofiles.os.remove(video_path)
+                except:
+                    pass
+    except Exception as e:
+        logger.error(f"❌ Split producer error: {e}")
+    
+    await queue.put(None)
+    return complete
 
 async def upload_video(
     client: Client,
@@ -77,10 +360,11 @@ async def upload_video(
     Otherwise, calculates them (legacy behavior).
     """
     try:
-        file_size_mb = os.path.getsize(video_path) / (1024 * 1024)
+        size_bytes = await aiofiles.os.path.getsize(video_path)
         
         # Check if split needed
-        if file_size_mb > SAFE_SPLIT_SIZE:
+        if size_bytes > SAFE_SPLIT_BYTES:
+            file_size_mb = size_bytes / (1024 * 1024)
             logger.info(f"🔪 File too large: {file_size_mb:.1f}MB, splitting...")
             if progress_msg:
                 await safe_edit(
@@ -90,62 +374,89 @@ async def upload_video(
                     f"Please wait..."
                 )
             
-            parts = split_video_file(video_path, SAFE_SPLIT_SIZE)
+            plan = await run_blocking(plan_video_split, video_path, SAFE_SPLIT_SIZE)
             
-            if not parts or len(parts) == 0:
-                return False
+            # Pipeline: the producer cuts + probes part i+1 while part i uploads
+            queue = asyncio.Queue(maxsize=2)
+            base_thumb = thumb_path if thumb_path and await aiofiles.os.path.exists(thumb_path) else None
+            producer = asyncio.create_task(_produce_video_parts(video_path, plan, queue, base_thumb))
             
-            # Upload each part
-            first_message_id = 0
-            for i, part_path in enumerate(parts, 1):
-                if not os.path.exists(part_path):
-                    continue
-                
-                # For split parts, we MUST recalculate metadata as duration changes
-                # But we can try to reuse the original thumbnail if possible, though strict pipeline
-                # usually means we just let it handle parts.
-                # However, `split_video_file` returns raw parts.
-                # We'll stick to calculating for parts to be safe.
-                metadata = get_video_metadata(part_path)
-                
-                # Generate thumbnail for this part
-                part_thumb_path = str(DOWNLOAD_DIR / f"thumb_part{i}_{os.getpid()}.jpg")
-                has_thumb = generate_thumbnail(part_path, part_thumb_path, metadata['duration'])
-                
-                part_caption = f"{caption}\n\n📦 Part {i}/{len(parts)}"
+            # Parts go out in order unless PART_UPLOAD_PARALLELISM allows overlap
+            parallel = max(1, PART_UPLOAD_PARALLELISM)
+            slots = asyncio.Semaphore(parallel)
+            
+            async def send_part(i, part):
+                part_path, metadata, part_thumb_path, total_parts = part
+                part_caption = f"{caption}\n\n📦 Part {i}/{total_parts}"
                 
-                tracker = UploadProgressTracker(progress_msg, i, len(parts)) if progress_msg else None
+                tracker = UploadProgressTracker(progress_msg, i, total_parts) if progress_msg else None
                 
                 try:
-                    sent_msg = await client.send_video(
-                        chat_id=chat_id,
+                    sent_msg = await _limited_send(
+                        client.send_video,
+                        chat_id,
+                        ordered=parallel == 1,
                         video=part_path,
                         caption=part_caption,
                         supports_streaming=True,
                         duration=metadata['duration'],
                         width=metadata['width'],
                         height=metadata['height'],
-                        thumb=part_thumb_path if has_thumb else None,
+                        thumb=part_thumb_path,
                         progress=tracker.progress_callback if tracker else None
                     )
-                    
-                    if i == 1:
-                        first_message_id = sent_msg.id
-                    
                     logger.info(f"✅ Part {i} uploaded (msg_id: {sent_msg.id})")
+                    return sent_msg.id
                 except FloodWait as e:
                     logger.warning(f"⏱️ FloodWait: {e.value}s")
                     await asyncio.sleep(e.value)
                 except Exception as e:
                     logger.error(f"Part {i} upload error: {e}")
-                
-                # Cleanup
+                finally:
+                    # Cleanup
+                    if part_thumb_path and part_thumb_path != base_thumb:
+                        release_thumb_path(part_thumb_path)
+                    try:
+                        await aiofiles.os.remove(part_path)
+                    except:
+                        pass
+                return 0
+            
+            async def send_part_slot(i, part):
                 try:
-                    os.remove(part_path)
-                    if has_thumb:
-                        os.remove(part_thumb_path)
-                except:
-                    pass
+                    return await send_part(i, part)
+                finally:
+                    slots.release()
+            
+            tasks = []
+            i = 0
+            try:
+                while True:
+                    # Take a part only when a slot is free, so the producer
+                    # stays at most the queue size ahead
+                    await slots.acquire()
+                    part = await queue.get()
+                    if part is None:
+                        slots.release()
+                        break
+                    i += 1
+                    tasks.append(asyncio.create_task(send_part_slot(i, part)))
+                message_ids = await asyncio.gather(*tasks)
+            except BaseException:
+                producer.cancel()
+                for task in tasks:
+                    task.cancel()
+                # Parts the producer queued but no task took
+                while not queue.empty():
+                    part = queue.get_nowait()
+                    if part:
+                        _discard_part(part, base_thumb)
+                raise
+            
+            first_message_id = message_ids[0] if message_ids else 0
+            
+            if not await producer:
+                return False
             
             return first_message_id if first_message_id > 0 else True
         
@@ -154,43 +465,42 @@ async def upload_video(
             
             # If metadata not provided, calculate it (Legacy/Fallback)
             if duration == 0:
-                metadata = get_video_metadata(video_path)
+                metadata = await run_blocking(get_video_metadata, video_path)
                 duration = metadata['duration']
                 width = metadata['width']
                 height = metadata['height']
             
             # If thumb not provided, generate it (Legacy/Fallback)
-            if not thumb_path or not os.path.exists(thumb_path):
-                 gen_thumb_path = str(DOWNLOAD_DIR / f"thumb_{os.getpid()}.jpg")
-                 if generate_thumbnail(video_path, gen_thumb_path, duration):
+            # Caller-provided thumbs are released by the caller
+            gen_thumb_path = None
+            if not thumb_path or not await aiofiles.os.path.exists(thumb_path):
+                 gen_thumb_path = acquire_thumb_path()
+                 if await run_blocking(generate_thumbnail, video_path, gen_thumb_path, duration):
                      thumb_path = gen_thumb_path
                  else:
                      thumb_path = None
 
             tracker = UploadProgressTracker(progress_msg) if progress_msg else None
             
-            sent_msg = await client.send_video(
-                chat_id=chat_id,
-                video=video_path,
-                caption=caption,
-                supports_streaming=True,
-                duration=duration,
-                width=width,
-                height=height,
-                thumb=thumb_path,
-                progress=tracker.progress_callback if tracker else None
-            )
+            try:
+                sent_msg = await _limited_send(
+                    client.send_video,
+                    chat_id,
+                    video=video_path,
+                    caption=caption,
+                    supports_streaming=True,
+                    duration=duration,
+                    width=width,
+                    height=height,
+                    thumb=thumb_path,
+                    progress=tracker.progress_callback if tracker else None
+                )
+            finally:
+                if gen_thumb_path:
+                    release_thumb_path(gen_thumb_path)
             
-            # Cleanup - Only clean up if we generated the thumb internally
-            # If thumb_path was passed in, caller is responsible (or we can clean it here?
-            # Better to let caller clean up artifacts they created, but to be safe and avoid leaks...)
-            # Actually, `batch_manager` creates it. Let's not delete `video_path` here if it was passed in?
-            # The original code deleted `video_path`.
-
             try:
-                os.remove(video_path)
-                if thumb_path and "thumb_" in thumb_path: # Simple check to see if it's a temp thumb
-                    os.remove(thumb_path)
+                await aiofiles.os.remove(video_path)
             except:
                 pass
             
@@ -219,15 +529,16 @@ async def upload_photo(
     try:
         tracker = UploadProgressTracker(progress_msg) if progress_msg else None
         
-        sent_msg = await client.send_photo(
-            chat_id=chat_id,
+        sent_msg = await _limited_send(
+            client.send_photo,
+            chat_id,
             photo=photo_path,
             caption=caption,
             progress=tracker.progress_callback if tracker else None
         )
         
         try:
-            os.remove(photo_path)
+            await aiofiles.os.remove(photo_path)
         except:
             pass
         
@@ -241,6 +552,64 @@ async def upload_photo(
         logger.error(f"Photo upload error: {e}")
         return False
 
+class FileSlice(io.RawIOBase):
+    """
+    Read-only window [start, start + length) over a file.
+    Lets a large document be uploaded in parts straight from the source
+    file, without writing .partNNN copies or holding a part in memory.
+    """
+    
+    def __init__(self, path: str, start: int, length: int, name: str):
+        super().__init__()
+        self._fd = os.open(path, os.O_RDONLY)
+        self._start = start
+        self._length = length
+        self._pos = 0
+        self.name = name
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(self._fd, start, length, os.POSIX_FADV_SEQUENTIAL)
+    
+    def readable(self) -> bool:
+        return True
+    
+    def seekable(self) -> bool:
+        return True
+    
+    def tell(self) -> int:
+        return self._pos
+    
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._length + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        self._pos = max(0, min(pos, self._length))
+        return self._pos
+    
+    def readinto(self, buffer) -> int:
+        count = min(len(buffer), self._length - self._pos)
+        if count <= 0:
+            return 0
+        offset = self._start + self._pos
+        if hasattr(os, 'preadv'):
+            # Read straight into the caller's buffer - no intermediate bytes
+            read = os.preadv(self._fd, [memoryview(buffer)[:count]], offset)
+        else:
+            data = os.pread(self._fd, count, offset)
+            read = len(data)
+            buffer[:read] = data
+        self._pos += read
+        return read
+    
+    def close(self):
+        if not self.closed:
+            os.close(self._fd)
+        super().close()
+
 async def upload_document(
     client: Client,
     chat_id: int,
@@ -253,73 +622,92 @@ async def upload_document(
     Returns message_id on success, False on failure
     """
     try:
-        file_size_mb = os.path.getsize(document_path) / (1024 * 1024)
+        size_bytes = await aiofiles.os.path.getsize(document_path)
         
-        if file_size_mb > SAFE_SPLIT_SIZE:
-            # For documents, use simple byte splitting
-            logger.info(f"🔪 Document too large: {file_size_mb:.1f}MB")
+        if size_bytes > SAFE_SPLIT_BYTES:
+            logger.info(f"🔪 Document too large: {size_bytes / (1024 * 1024):.1f}MB")
             
-            chunk_size = int(SAFE_SPLIT_SIZE * 1024 * 1024)
             parts = []
             
-            with open(document_path, 'rb') as source:
-                part_num = 1
-                while True:
-                    chunk = source.read(chunk_size)
-                    if not chunk:
-                        break
+            # Video containers: ffmpeg split keeps every part playable
+            mime_type = mimetypes.guess_type(document_path)[0] or ''
+            if mime_type.startswith('video/'):
+                parts = await run_blocking(split_video_file, document_path, SAFE_SPLIT_SIZE)
+                if len(parts) < 2:
+                    parts = []
+            
+            # Everything else (or failed video split): byte ranges of the
+            # source file are uploaded directly, no part files on disk
+            total_parts = len(parts) if parts else -(-size_bytes // SAFE_SPLIT_BYTES)
+            base_name = os.path.basename(document_path)
+            
+            # Upload parts
+            first_message_id = 0
+            try:
+                for i in range(1, total_parts + 1):
+                    part_caption = f"{caption}\n\n📦 Part {i}/{total_parts}"
+                    
+                    tracker = UploadProgressTracker(progress_msg, i, total_parts) if progress_msg else None
                     
-                    part_name = f"{os.path.basename(document_path)}.part{part_num:03d}"
-                    part_path = str(DOWNLOAD_DIR / part_name)
+                    if parts:
+                        document = parts[i - 1]
+                    else:
+                        offset = (i - 1) * SAFE_SPLIT_BYTES
+                        document = FileSlice(
+                            document_path, offset, min(SAFE_SPLIT_BYTES, size_bytes - offset),
+                            f"{base_name}.part{i:03d}"
+                        )
                     
-                    with open(part_path, 'wb') as part:
-                        part.write(chunk)
+                    try:
+                        sent_msg = await _limited_send(
+                            client.send_document,
+                            chat_id,
+                            document=document,
+                            caption=part_caption,
+                            progress=tracker.progress_callback if tracker else None
+                        )
+                    finally:
+                        if parts:
+                            try:
+                                await aiofiles.os.remove(document)
+                            except:
+                                pass
+                        else:
+                            document.close()
+                    
+                    if i == 1:
+                        first_message_id = sent_msg.id
                     
-                    parts.append(part_path)
-                    part_num += 1
+                    logger.info(f"✅ Part {i} uploaded (msg_id: {sent_msg.id})")
             
-            # Upload parts
-            first_message_id = 0
-            for i, part_path in enumerate(parts, 1):
-                part_caption = f"{caption}\n\n📦 Part {i}/{len(parts)}"
-                
-                tracker = UploadProgressTracker(progress_msg, i, len(parts)) if progress_msg else None
-                
-                sent_msg = await client.send_document(
-                    chat_id=chat_id,
-                    document=part_path,
-                    caption=part_caption,
-                    progress=tracker.progress_callback if tracker else None
-                )
-                
-                if i == 1:
-                    first_message_id = sent_msg.id
-                
-                logger.info(f"✅ Part {i} uploaded (msg_id: {sent_msg.id})")
-                
-                try:
-                    os.remove(part_path)
-                except:
-                    pass
+            finally:
+                # After a failed send, drop the parts not uploaded yet: the
+                # source is already gone, so nothing else would remove them
+                for part in parts[i:]:
+                    try:
+                        await aiofiles.os.remove(part)
+                    except:
+                        pass
             
             try:
-                os.remove(document_path)
+                await aiofiles.os.remove(document_path)
             except:
                 pass
             
             return first_message_id if first_message_id > 0 else True
         else:
-            tracker = UploadProgressTracker(progress_msg) if progress_msg else None
+            tracker = UploadProgressTracker(progress_msg, total_size_hint=size_bytes) if progress_msg else None
             
-            sent_msg = await client.send_document(
-                chat_id=chat_id,
+            sent_msg = await _limited_send(
+                client.send_document,
+                chat_id,
                 document=document_path,
                 caption=caption,
                 progress=tracker.progress_callback if tracker else None
             )
             
             try:
-                os.remove(document_path)
+                await aiofiles.os.remove(document_path)
             except:
                 pass
             
@@ -344,13 +732,7 @@ async def send_failed_link(
 ) -> bool:
     """Send failed link message"""
     try:
-        emoji_map = {
-            'video': '🎬',
-            'image': '🖼️',
-            'document': '📄'
-        }
-        
-        emoji = emoji_map.get(file_type, '📦')
+        emoji = _TYPE_EMOJI.get(file_type, '📦')
         
         message = (
             f"❌ **MANUAL DOWNLOAD REQUIRED**\n\n"
@@ -360,12 +742,13 @@ async def send_failed_link(
             f"💡 Copy link and download manually"
         )
         
-        await safe_send(
-            client,
-            chat_id=chat_id,
-            text=message,
-            disable_web_page_preview=False
-        )
+        async with _chat_limiters[chat_id]:
+            await safe_send(
+                client,
+                chat_id=chat_id,
+                text=message,
+                disable_web_page_preview=False
+            )
         
         return True
     except Exception as e:
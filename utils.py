@@ -1,74 +1,103 @@
 import re
-import os
 import asyncio
 import logging
-from typing import List, Dict, Optional, Union
-from urllib.parse import urlparse
+import time
+from collections import Counter
+from typing import List, Dict, Optional
 from pyrogram.errors import FloodWait
 from pyrogram.types import Message, CallbackQuery
 from config import SUPPORTED_TYPES
 
 logger = logging.getLogger(__name__)
 
+# Patterns, compiled once
+_YOUTUBE_PATTERN = r'youtube\.com/(?:watch\?v=|embed/|shorts/)|youtu\.be/'
+_YOUTUBE_RE = re.compile(_YOUTUBE_PATTERN, re.IGNORECASE)
+_MPD_MARKERS = ('.mpd', '/manifest.')
+# YouTube or MPD in one pass
+_FAILED_URL_RE = re.compile(_YOUTUBE_PATTERN + r'|\.mpd|/manifest\.', re.IGNORECASE)
+
+_SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+
+# Default-length progress bars, indexed by filled cells
+_BARS_20 = tuple("█" * i + "░" * (20 - i) for i in range(21))
+
+# Extension -> type (earlier SUPPORTED_TYPES entries win)
+_EXT_TYPES = {
+    ext: ftype
+    for ftype, exts in reversed(list(SUPPORTED_TYPES.items()))
+    for ext in exts
+}
+
+_UNSAFE_FILENAME_RE = re.compile(r'[^\w\s-]')
+# Same rule as a translate table for ASCII names
+_UNSAFE_ASCII_TABLE = {
+    i: None for i in range(128) if _UNSAFE_FILENAME_RE.match(chr(i))
+}
+_TME_C_RE = re.compile(r't\.me/c/(\d+)')
+# Markdown/spacing stripped from channel ID input, and sign characters
+_CHANNEL_FORMATTING = str.maketrans('', '', '`*_ ')
+_SIGNS = str.maketrans('', '', '-+')
+# Whole-input channel ID forms: -100XXXXXXXXX, -XXXX, XXXXXXXXXX (10+ digits)
+_CHANNEL_ID_RE = re.compile(r'(?P<full>-100[-+\d]*)|-(?P<negative>\d+)|(?P<bare>\d{10,})')
+
+# One line of "Title: URL" (title up to the first colon, URL part must
+# contain http:// or https://); auto content may start with "[TOPIC]"
+_LINE_BODY = r'([^:\n]*?)[^\S\n]*:[^\S\n]*(.*?https?://.*?)[^\S\n]*$'
+_TXT_LINE_RE = re.compile(r'^[^\S\n]*' + _LINE_BODY, re.MULTILINE)
+_AUTO_LINE_RE = re.compile(r'^[^\S\n]*(?:\[([^\]\n]*)\][^\S\n]*)?' + _LINE_BODY, re.MULTILINE)
+
+async def _flood_retry(name: str, make_call):
+    """Await make_call(), sleeping out FloodWaits; None on any other error"""
+    while True:
+        try:
+            return await make_call()
+        except FloodWait as e:
+            logger.warning(f"⏳ FloodWait: Sleeping {e.value}s")
+            await asyncio.sleep(e.value + 1)
+        except Exception as e:
+            logger.error(f"❌ {name} error: {e}")
+            return None
+
 async def safe_send(client, chat_id, text, **kwargs):
     """Safe send_message wrapper handling FloodWait"""
-    try:
-        return await client.send_message(chat_id, text, **kwargs)
-    except FloodWait as e:
-        logger.warning(f"⏳ FloodWait: Sleeping {e.value}s")
-        await asyncio.sleep(e.value + 1)
-        return await safe_send(client, chat_id, text, **kwargs)
-    except Exception as e:
-        logger.error(f"❌ safe_send error: {e}")
-        return None
+    return await _flood_retry('safe_send', lambda: client.send_message(chat_id, text, **kwargs))
 
 async def safe_reply(message: Message, text, **kwargs):
     """Safe reply_text wrapper handling FloodWait"""
-    try:
-        return await message.reply_text(text, **kwargs)
-    except FloodWait as e:
-        logger.warning(f"⏳ FloodWait: Sleeping {e.value}s")
-        await asyncio.sleep(e.value + 1)
-        return await safe_reply(message, text, **kwargs)
-    except Exception as e:
-        logger.error(f"❌ safe_reply error: {e}")
-        return None
+    return await _flood_retry('safe_reply', lambda: message.reply_text(text, **kwargs))
 
 async def safe_edit(message: Message, text, **kwargs):
     """Safe edit_text wrapper handling FloodWait"""
-    try:
-        return await message.edit_text(text, **kwargs)
-    except FloodWait as e:
-        logger.warning(f"⏳ FloodWait: Sleeping {e.value}s")
-        await asyncio.sleep(e.value + 1)
-        return await safe_edit(message, text, **kwargs)
-    except Exception as e:
-        logger.error(f"❌ safe_edit error: {e}")
-        return None
+    return await _flood_retry('safe_edit', lambda: message.edit_text(text, **kwargs))
 
 async def safe_answer(callback: CallbackQuery, text, **kwargs):
     """Safe answer wrapper handling FloodWait"""
-    try:
-        return await callback.answer(text, **kwargs)
-    except FloodWait as e:
-        logger.warning(f"⏳ FloodWait: Sleeping {e.value}s")
-        await asyncio.sleep(e.value + 1)
-        return await safe_answer(callback, text, **kwargs)
-    except Exception as e:
-        logger.error(f"❌ safe_answer error: {e}")
-        return None
+    return await _flood_retry('safe_answer', lambda: callback.answer(text, **kwargs))
 
 async def safe_send_document(client, chat_id, document, **kwargs):
     """Safe send_document wrapper handling FloodWait"""
-    try:
-        return await client.send_document(chat_id, document, **kwargs)
-    except FloodWait as e:
-        logger.warning(f"⏳ FloodWait: Sleeping {e.value}s")
-        await asyncio.sleep(e.value + 1)
-        return await safe_send_document(client, chat_id, document, **kwargs)
-    except Exception as e:
-        logger.error(f"❌ safe_send_document error: {e}")
-        return None
+    return await _flood_retry('safe_send_document', lambda: client.send_document(chat_id, document, **kwargs))
+
+class RateLimiter:
+    """Async context manager spacing calls to at most `rate` per `period` seconds"""
+    
+    def __init__(self, rate: float, period: float = 1.0):
+        self.interval = period / rate
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+    
+    async def __aenter__(self):
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_slot = max(now, self._next_slot) + self.interval
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
 
 def clean_title(text: str) -> str:
     """Clean title - remove : from middle"""
@@ -78,7 +107,10 @@ def clean_title(text: str) -> str:
 
 def sanitize_filename(filename: str, max_length: int = 60) -> str:
     """Sanitize filename for safe file system usage"""
-    safe = re.sub(r'[^\w\s-]', '', filename)
+    if filename.isascii():
+        safe = filename.translate(_UNSAFE_ASCII_TABLE)
+    else:
+        safe = _UNSAFE_FILENAME_RE.sub('', filename)
     safe = safe.replace(' ', '_')
     return safe[:max_length].strip('_')
 
@@ -87,11 +119,9 @@ def format_size(bytes_size: int) -> str:
     if bytes_size < 0:
         return "0 B"
     
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if bytes_size < 1024.0:
-            return f"{bytes_size:.2f} {unit}"
-        bytes_size /= 1024.0
-    return f"{bytes_size:.2f} TB"
+    # Unit index straight from the bit length: 1024**i <= size < 1024**(i+1)
+    i = min((int(bytes_size).bit_length() - 1) // 10, 4) if bytes_size >= 1 else 0
+    return f"{bytes_size / (1 << (10 * i)):.2f} {_SIZE_UNITS[i]}"
 
 def format_time(seconds: int) -> str:
     """Format seconds to readable time"""
@@ -112,13 +142,24 @@ def format_time(seconds: int) -> str:
 def create_progress_bar(percent: float, length: int = 20) -> str:
     """Create visual progress bar"""
     filled = int(length * percent / 100)
-    bar = "█" * filled + "░" * (length - filled)
+    if length == 20 and 0 <= filled <= 20:
+        bar = _BARS_20[filled]
+    else:
+        bar = "█" * filled + "░" * (length - filled)
     return f"[{bar}] {percent:.1f}%"
 
 def get_file_type(url: str) -> str:
     """Detect file type from URL"""
     url_lower = url.lower()
     
+    # Fast path: extension of the URL path
+    path = url_lower.split('?', 1)[0].split('#', 1)[0]
+    dot = path.rfind('.')
+    if dot > path.rfind('/'):
+        file_type = _EXT_TYPES.get(path[dot:])
+        if file_type:
+            return file_type
+    
     # Video detection
     if any(ext in url_lower for ext in SUPPORTED_TYPES['video']):
         return 'video'
@@ -139,99 +180,74 @@ def get_file_type(url: str) -> str:
 
 def parse_txt_content(text: str) -> List[Dict]:
     """Parse TXT file content - Format: Title: URL"""
-    lines = text.strip().split('\n')
     items = []
     
-    for line in lines:
-        line = line.strip()
-        if not line or not (':' in line and ('http://' in line or 'https://' in line)):
-            continue
+    for match in _TXT_LINE_RE.finditer(text):
+        title, url = match.groups()
+        file_type = get_file_type(url)
         
-        parts = line.split(':', 1)
-        if len(parts) == 2:
-            title = parts[0].strip()
-            url = parts[1].strip()
-            
-            file_type = get_file_type(url)
-            
-            if file_type != 'unknown':
-                items.append({
-                    'title': title,
-                    'url': url,
-                    'type': file_type
-                })
+        if file_type != 'unknown':
+            items.append({
+                'title': title,
+                'url': url,
+                'type': file_type
+            })
     
     return items
 
 def parse_auto_content(text: str) -> List[Dict]:
     """Parse auto mode content - Format: [TOPIC] Title: URL"""
-    lines = text.strip().split('\n')
     items = []
     
-    for line in lines:
-        line = line.strip()
-        if not line or not (':' in line and ('http://' in line or 'https://' in line)):
-            continue
-        
-        # Extract topic if present
-        topic = ""
-        if line.startswith('[') and ']' in line:
-            topic_end = line.index(']')
-            topic = line[1:topic_end].strip()
-            line = line[topic_end+1:].strip()
+    for match in _AUTO_LINE_RE.finditer(text):
+        topic, title, url = match.groups()
+        file_type = get_file_type(url)
         
-        parts = line.split(':', 1)
-        if len(parts) == 2:
-            title = parts[0].strip()
-            url = parts[1].strip()
-            
-            file_type = get_file_type(url)
-            
-            if file_type != 'unknown':
-                items.append({
-                    'title': title,
-                    'url': url,
-                    'type': file_type,
-                    'topic': topic
-                })
+        if file_type != 'unknown':
+            items.append({
+                'title': title,
+                'url': url,
+                'type': file_type,
+                'topic': topic.strip() if topic else ""
+            })
     
     return items
 
 def is_youtube_url(url: str) -> bool:
     """Check if YouTube URL"""
-    patterns = [
-        r'youtube\.com/watch\?v=',
-        r'youtu\.be/',
-        r'youtube\.com/embed/',
-        r'youtube\.com/shorts/'
-    ]
-    return any(re.search(p, url, re.IGNORECASE) for p in patterns)
+    return _YOUTUBE_RE.search(url) is not None
 
 def is_mpd_url(url: str) -> bool:
     """Check if MPD URL"""
-    return '.mpd' in url.lower() or '/manifest.' in url.lower()
+    url_lower = url.lower()
+    return any(marker in url_lower for marker in _MPD_MARKERS)
 
 def is_failed_url(url: str) -> bool:
     """Check if URL should fail (YouTube or MPD)"""
-    return is_youtube_url(url) or is_mpd_url(url)
+    return _FAILED_URL_RE.search(url) is not None
 
 def count_content_types(items: List[Dict]) -> Dict:
     """Count different content types"""
-    counts = {'video': 0, 'image': 0, 'document': 0}
-    for item in items:
-        ftype = item.get('type', 'unknown')
-        if ftype in counts:
-            counts[ftype] += 1
-    return counts
+    counts = Counter(item.get('type') for item in items)
+    return {ftype: counts[ftype] for ftype in ('video', 'image', 'document')}
 
 def format_indian_time(time_str: str) -> Optional[str]:
     """
     Parse Indian time format (09:00 AM) to 24-hour format (09:00)
     """
     try:
-        from datetime import datetime
-        time_obj = datetime.strptime(time_str, "%I:%M %p")
-        return time_obj.strftime("%H:%M")
+        clock, meridiem = time_str.split()
+        hour_str, minute_str = clock.split(':')
+        if not (clock.isascii() and hour_str.isdigit() and minute_str.isdigit()) or len(hour_str) > 2 or len(minute_str) > 2:
+            return None
+        
+        hour, minute = int(hour_str), int(minute_str)
+        meridiem = meridiem.upper()
+        if not (1 <= hour <= 12 and minute <= 59) or meridiem not in ('AM', 'PM'):
+            return None
+        
+        hour = hour % 12 + (12 if meridiem == 'PM' else 0)
+        return f"{hour:02d}:{minute:02d}"
     except:
         return None
 
@@ -248,36 +264,39 @@ def extract_channel_id(text: str) -> Optional[int]:
         text = text.strip()
         
         # Remove formatting
-        text = text.replace('`', '').replace('*', '').replace('_', '').replace(' ', '')
+        text = text.translate(_CHANNEL_FORMATTING)
         
-        logger.info(f"🔍 Extracting ID from: {text}")
+        logger.info("🔍 Extracting ID from: %s", text)
+        
+        match = _CHANNEL_ID_RE.fullmatch(text)
+        kind = match.lastgroup if match else None
         
         # Method 1: Standard format -100XXXXXXXXX
-        if text.startswith('-100'):
-            clean_text = text.replace('-', '').replace('+', '')
-            if clean_text.isdigit() and len(clean_text) >= 10:
+        if kind == 'full':
+            clean_text = text.translate(_SIGNS)
+            if len(clean_text) >= 10:
                 channel_id = int('-' + clean_text)
-                logger.info(f"✅ Extracted: {channel_id}")
+                logger.info("✅ Extracted: %s", channel_id)
                 return channel_id
         
         # Method 2: Negative number format
-        elif text.startswith('-') and text[1:].isdigit():
+        elif kind == 'negative':
             channel_id = int(text)
-            logger.info(f"✅ Extracted: {channel_id}")
+            logger.info("✅ Extracted: %s", channel_id)
+            return channel_id
+        
+        # Method 3: Pure numeric (assume needs -100 prefix)
+        elif kind == 'bare':
+            channel_id = int('-100' + text)
+            logger.info("✅ Converted to: %s", channel_id)
             return channel_id
         
-        # Method 3: From t.me/c/XXXXXX links
-        match = re.search(r't\.me/c/(\d+)', text)
+        # Method 4: From t.me/c/XXXXXX links
+        match = _TME_C_RE.search(text)
         if match:
             # Convert to proper -100XXXXXX format
             channel_id = int('-100' + match.group(1))
-            logger.info(f"✅ Extracted from link: {channel_id}")
-            return channel_id
-        
-        # Method 4: Pure numeric (assume needs -100 prefix)
-        if text.isdigit() and len(text) >= 10:
-            channel_id = int('-100' + text)
-            logger.info(f"✅ Converted to: {channel_id}")
+            logger.info("✅ Extracted from link: %s", channel_id)
             return channel_id
         
         logger.error(f"❌ Invalid channel ID format: {text}")
@@ -1,110 +1,446 @@
 import os
+import re
+import csv
+import glob
+import json
+import struct
+import asyncio
 import subprocess
 import logging
+import select
+import signal
+import threading
 import shutil
-from pathlib import Path
-from typing import Tuple, Optional, List
-from config import THUMB_WIDTH, THUMB_HEIGHT
-from utils import format_size
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Tuple, Optional, List
+try:
+    import av  # PyAV: probes in-process, no ffprobe spawn
+except ImportError:
+    av = None
+
+from config import THUMB_WIDTH, THUMB_HEIGHT, THUMB_POOL_SIZE, DOWNLOAD_DIR, FFPATHS_CACHE, MAX_SPLIT_WORKERS, FFMPEG_THREADS
 
 logger = logging.getLogger(__name__)
 
+# Matched against raw ffmpeg stderr bytes (no decode of the banner)
+_DURATION_RE = re.compile(rb'Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)')
+
 # FFmpeg availability flags
 FFMPEG_AVAILABLE = False
 FFPROBE_AVAILABLE = False
 
+# Hardware decoder for thumbnails ('cuda', 'vaapi' or None)
+HWACCEL = None
+
+# hwaccel -> device node that must exist for it to be usable
+_HWACCEL_DEVICES = (
+    ('cuda', '/dev/nvidiactl'),
+    ('vaapi', '/dev/dri/renderD128'),
+)
+
+# With an absolute executable and close_fds=False, CPython launches
+# children via posix_spawn (vfork) instead of fork + exec. Safe here:
+# Python opens its own fds with O_CLOEXEC, so nothing extra leaks.
+_SPAWN_KWARGS = {'close_fds': False}
+
+def _spawn_quiet(cmd: List[str]) -> subprocess.Popen:
+    """Start a command whose output is discarded"""
+    return subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **_SPAWN_KWARGS)
+
+def _spawn_stderr_tail(cmd: List[str], max_lines: int = 20) -> Tuple[subprocess.Popen, Callable[[], str]]:
+    """
+    Start a command, keeping only the last max_lines lines of its stderr
+    (drained by a reader thread, so memory stays bounded on long jobs).
+    Returns (proc, tail); tail() gives the kept lines once proc has exited.
+    """
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, **_SPAWN_KWARGS)
+    lines = deque(maxlen=max_lines)
+
+    def drain():
+        with proc.stderr:
+            for line in proc.stderr:
+                lines.append(line)
+
+    reader = threading.Thread(target=drain, daemon=True)
+    reader.start()
+
+    def tail() -> str:
+        reader.join(1)
+        return b''.join(lines).decode(errors='replace').strip()
+
+    return proc, tail
+
+def _wait_quiet(proc: subprocess.Popen, timeout: float) -> Optional[int]:
+    """
+    Wait for proc; returns its exit code, or None after killing it on timeout.
+    Waits on a pidfd (Linux 5.3+) so the kernel wakes us when the child
+    exits, instead of Popen.wait(timeout) polling waitpid with sleeps.
+    poll() rather than select(): the fd may be above FD_SETSIZE (1024)
+    in a long-running bot. On any error the child is killed and reaped.
+    """
+    try:
+        try:
+            pidfd = os.pidfd_open(proc.pid)
+        except (AttributeError, OSError):
+            # No pidfd support (older Python/kernel): plain wait
+            pidfd = None
+
+        if pidfd is None:
+            try:
+                return proc.wait(timeout)
+            except subprocess.TimeoutExpired:
+                pass
+        else:
+            try:
+                poller = select.poll()
+                poller.register(pidfd, select.POLLIN)
+                ready = poller.poll(timeout * 1000)
+            finally:
+                os.close(pidfd)
+            if ready:
+                return proc.wait()
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+
+    proc.kill()
+    proc.wait()
+    return None
+
+def _run_quiet(cmd: List[str], timeout: float) -> subprocess.CompletedProcess:
+    """subprocess.run for commands whose output is discarded (pidfd wait)"""
+    returncode = _wait_quiet(_spawn_quiet(cmd), timeout)
+    if returncode is None:
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    return subprocess.CompletedProcess(cmd, returncode)
+
+def _is_executable(path: str) -> bool:
+    return os.path.isfile(path) and os.access(path, os.X_OK)
+
+# Heroku / apt buildpack locations, checked before PATH
+_BINARY_DIRS = ('/usr/bin', '/usr/local/bin', '/app/.apt/usr/bin')
+
+def _locate_binary(name: str) -> Optional[str]:
+    """
+    Absolute path of an executable `name` binary (ffmpeg, ffprobe, ...), or None.
+    Known locations first, then a single PATH lookup. Not test-run: a broken
+    binary shows up as a failed return code at its first real use.
+    """
+    path = next(
+        (p for p in (os.path.join(d, name) for d in _BINARY_DIRS) if _is_executable(p)),
+        None
+    )
+    if path:
+        return path
+
+    found = shutil.which(name)
+    # Absolute, so subprocess never has to search PATH for it
+    return os.path.abspath(found) if found else None
+
+def _list_hwaccels(ffmpeg_path: str) -> List[str]:
+    """Hardware decoders compiled into this ffmpeg build"""
+    try:
+        result = subprocess.run(
+            [ffmpeg_path, '-hide_banner', '-hwaccels'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            timeout=5,
+            **_SPAWN_KWARGS
+        )
+        # First line is the "Hardware acceleration methods:" header
+        return result.stdout.decode(errors='ignore').split()[3:]
+    except Exception:
+        return []
+
+def _load_ffpaths_cache() -> dict:
+    """
+    Binaries detected on an earlier start, so restarts skip the search and
+    the -hwaccels spawn. The cache picks which executables run, so it is
+    only trusted if this user owns it, nobody else can write it, and it
+    was written under the same $PATH.
+    """
+    try:
+        with open(FFPATHS_CACHE) as f:
+            st = os.fstat(f.fileno())
+            if st.st_uid != os.getuid() or st.st_mode & 0o022:
+                logger.warning(f"⚠️ Ignoring {FFPATHS_CACHE}: not owned by us or writable by others")
+                return {}
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if not isinstance(cached, dict) or cached.get('PATH') != os.environ.get('PATH', ''):
+        return {}
+    return cached
+
+def _save_ffpaths_cache(ffmpeg_path: str, ffprobe_path: str, hwaccels: List[str]):
+    """Write the detection result, readable and writable by this user only"""
+    try:
+        fd = os.open(FFPATHS_CACHE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)  # An existing file keeps its mode otherwise
+        with open(fd, 'w') as f:
+            json.dump({
+                'PATH': os.environ.get('PATH', ''),
+                'ffmpeg': ffmpeg_path,
+                'ffprobe': ffprobe_path,
+                'hwaccels': hwaccels,
+            }, f)
+    except OSError:
+        pass
+
 def check_ffmpeg():
     """
     Enhanced FFmpeg check with multiple paths for Heroku
     """
-    global FFMPEG_AVAILABLE, FFPROBE_AVAILABLE
-    
-    # Possible FFmpeg locations on Heroku
-    possible_paths = [
-        '/usr/bin/ffmpeg',
-        '/usr/local/bin/ffmpeg',
-        '/app/.apt/usr/bin/ffmpeg',
-        'ffmpeg'
-    ]
+    global FFMPEG_AVAILABLE, FFPROBE_AVAILABLE, HWACCEL
     
-    ffmpeg_path = None
-    for path in possible_paths:
-        if shutil.which(path) or os.path.exists(path):
-            ffmpeg_path = path if os.path.exists(path) else shutil.which(path)
-            break
+    cached = _load_ffpaths_cache()
     
-    if not ffmpeg_path:
-        ffmpeg_path = shutil.which('ffmpeg')
-    
-    if ffmpeg_path:
-        try:
-            result = subprocess.run(
-                [ffmpeg_path, '-version'], 
-                capture_output=True, 
-                timeout=5
-            )
-            if result.returncode == 0:
-                FFMPEG_AVAILABLE = True
-                logger.info(f"✅ FFmpeg found at: {ffmpeg_path}")
-                os.environ['FFMPEG_PATH'] = ffmpeg_path
-        except Exception as e:
-            logger.error(f"FFmpeg test failed: {e}")
-    
-    # Check ffprobe
-    possible_probe_paths = [
-        '/usr/bin/ffprobe',
-        '/usr/local/bin/ffprobe',
-        '/app/.apt/usr/bin/ffprobe',
-        'ffprobe'
-    ]
-    
-    ffprobe_path = None
-    for path in possible_probe_paths:
-        if shutil.which(path) or os.path.exists(path):
-            ffprobe_path = path if os.path.exists(path) else shutil.which(path)
-            break
+    ffmpeg_path = cached.get('ffmpeg')
+    ffprobe_path = cached.get('ffprobe')
+    if (ffmpeg_path and ffprobe_path and os.path.isabs(ffmpeg_path) and os.path.isabs(ffprobe_path)
+            and _is_executable(ffmpeg_path) and _is_executable(ffprobe_path)):
+        FFMPEG_AVAILABLE = FFPROBE_AVAILABLE = True
+        hwaccels = cached.get('hwaccels', [])
+    else:
+        ffmpeg_path = _locate_binary('ffmpeg')
+        ffprobe_path = _locate_binary('ffprobe')
+        FFMPEG_AVAILABLE = bool(ffmpeg_path)
+        FFPROBE_AVAILABLE = bool(ffprobe_path)
+        hwaccels = _list_hwaccels(ffmpeg_path) if FFMPEG_AVAILABLE else []
+        
+        # Only a complete result is cached; partial installs re-check each start
+        if FFMPEG_AVAILABLE and FFPROBE_AVAILABLE:
+            _save_ffpaths_cache(ffmpeg_path, ffprobe_path, hwaccels)
     
-    if not ffprobe_path:
-        ffprobe_path = shutil.which('ffprobe')
+    # Compiled-in is not enough: the device has to be there too
+    HWACCEL = next(
+        (name for name, device in _HWACCEL_DEVICES if name in hwaccels and os.path.exists(device)),
+        None
+    )
     
-    if ffprobe_path:
-        try:
-            result = subprocess.run(
-                [ffprobe_path, '-version'],
-                capture_output=True,
-                timeout=5
-            )
-            if result.returncode == 0:
-                FFPROBE_AVAILABLE = True
-                logger.info(f"✅ FFprobe found at: {ffprobe_path}")
-                os.environ['FFPROBE_PATH'] = ffprobe_path
-        except Exception as e:
-            logger.error(f"FFprobe test failed: {e}")
+    if FFMPEG_AVAILABLE:
+        logger.info(f"✅ FFmpeg found at: {ffmpeg_path}")
+        os.environ['FFMPEG_PATH'] = ffmpeg_path
+        if HWACCEL:
+            logger.info(f"✅ Thumbnail decode via {HWACCEL}")
+    if FFPROBE_AVAILABLE:
+        logger.info(f"✅ FFprobe found at: {ffprobe_path}")
+        os.environ['FFPROBE_PATH'] = ffprobe_path
     
     if not FFMPEG_AVAILABLE:
         logger.warning("⚠️ FFmpeg NOT available - Finalization will fail")
     if not FFPROBE_AVAILABLE:
-        logger.warning("⚠️ FFprobe NOT available - Validation will fail")
+        logger.warning("⚠️ FFprobe NOT available - only MP4/PyAV probes will work")
+
+# check_ffmpeg runs on first use, not on import
+_INIT_DONE = False
+_INIT_LOCK = threading.Lock()
+
+def _ensure_init():
+    """Run check_ffmpeg once, from whichever thread needs ffmpeg first"""
+    global _INIT_DONE
+    if _INIT_DONE:
+        return
+    with _INIT_LOCK:
+        if not _INIT_DONE:
+            check_ffmpeg()
+            _INIT_DONE = True
+
+# Shared pool for blocking ffmpeg/ffprobe calls.
+# The heavy work runs in the ffmpeg child process, so threads are enough
+# to keep the event loop free while several files are probed at once.
+FFMPEG_EXECUTOR = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+
+# Finalize runs get their own pool so that concurrent ffmpegs x -threads
+# roughly matches the core count instead of oversubscribing it
+# (each finalize runs two ffmpegs: copy and audio-transcode attempts)
+FFMPEG_THREADS_ARG = str(FFMPEG_THREADS)
+FINALIZE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=max(1, (os.cpu_count() or 4) // (2 * max(1, FFMPEG_THREADS)))
+)
 
-# Run check on import
-check_ffmpeg()
+# Caps concurrent finalize runs however they are called (pool or
+# run_blocking): each one is up to two ffmpegs plus their output files
+_FINALIZE_SLOTS = threading.BoundedSemaphore(max(1, (os.cpu_count() or 4) // 2))
+
+async def run_blocking(func, *args):
+    """Run a blocking video_processor function without stalling the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(FFMPEG_EXECUTOR, func, *args)
+
+def finalize_video_async(input_path: str) -> Future:
+    """
+    Start finalize_video in the background and return its Future.
+    Kick it off as soon as a download finishes so the next download can
+    run meanwhile; await asyncio.wrap_future(fut) where the path is needed.
+    """
+    return FINALIZE_EXECUTOR.submit(finalize_video, input_path)
+
+def generate_thumbnail_async(video_path: str, thumb_path: str, duration: int = 0) -> Future:
+    """Background generate_thumbnail, same contract as finalize_video_async"""
+    return FFMPEG_EXECUTOR.submit(generate_thumbnail, video_path, thumb_path, duration)
+
+# Reusable thumbnail paths. The JPEG is unlinked on release and before
+# every ffmpeg attempt, so a stale frame from an earlier item is never
+# mistaken for a fresh thumbnail
+_THUMB_PREFIX = os.path.join(str(DOWNLOAD_DIR), "thumb_")
+_THUMB_POOL = deque(f"{_THUMB_PREFIX}{i}.jpg" for i in range(THUMB_POOL_SIZE))
+_thumb_count = THUMB_POOL_SIZE
+
+def acquire_thumb_path() -> str:
+    """Take a thumbnail path from the pool (grows it if exhausted)"""
+    global _thumb_count
+    if _THUMB_POOL:
+        return _THUMB_POOL.popleft()
+    path = f"{_THUMB_PREFIX}{_thumb_count}.jpg"
+    _thumb_count += 1
+    return path
+
+def _remove_quiet(path: str):
+    """os.remove, ignoring a missing file"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def release_thumb_path(path: str):
+    """Delete the thumbnail and return its path to the pool"""
+    _remove_quiet(path)
+    _THUMB_POOL.append(path)
+
+def cleanup_thumb_pool():
+    """Remove pooled thumbnail files (on shutdown)"""
+    for path in _THUMB_POOL:
+        _remove_quiet(path)
 
 def get_ffmpeg_path():
     """Get FFmpeg path from environment or search"""
+    _ensure_init()
     return os.environ.get('FFMPEG_PATH', 'ffmpeg')
 
 def get_ffprobe_path():
     """Get FFprobe path from environment or search"""
+    _ensure_init()
     return os.environ.get('FFPROBE_PATH', 'ffprobe')
 
+def _size_if_exists(path: str, min_bytes: int = 1024) -> int:
+    """File size if the file exists and is larger than min_bytes, else 0 (one stat)"""
+    try:
+        size = os.stat(path).st_size
+    except OSError:
+        return 0
+    return size if size > min_bytes else 0
+
+def _top_level_boxes(f, file_size: int):
+    """
+    Yield (box_type, offset, header_len, size) for the top-level
+    ISOBMFF boxes of an open file. Reads box headers only.
+    """
+    offset = 0
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        header = f.read(16)
+        size, box_type = struct.unpack('>I4s', header[:8])
+        header_len = 8
+        if size == 1:  # 64-bit largesize follows
+            size = struct.unpack('>Q', header[8:16])[0]
+            header_len = 16
+        elif size == 0:  # Box runs to end of file
+            size = file_size - offset
+
+        yield box_type, offset, header_len, size
+        if size < header_len:
+            return
+        offset += size
+
+def _child_boxes(data: bytes, start: int, end: int):
+    """Yield (box_type, content_start, box_end) for boxes in data[start:end]"""
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        header_len = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header_len = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_len:
+            return
+        yield box_type, offset + header_len, min(offset + size, end)
+        offset += size
+
+# ftyp major brands of plain MP4 files. Other ISOBMFF files (QuickTime
+# 'qt  ', 3GP, DASH segments, ...) still go through the remux to come out as MP4
+_MP4_BRANDS = frozenset({
+    b'isom', b'iso2', b'iso3', b'iso4', b'iso5', b'iso6',
+    b'mp41', b'mp42', b'avc1',
+})
+
+def _has_child_box(f, start: int, end: int, wanted: bytes) -> bool:
+    """Whether the box spanning [start, end) of an open file has a `wanted` child"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(16)
+        size, box_type = struct.unpack('>I4s', header[:8])
+        if box_type == wanted:
+            return True
+        if size == 1:
+            size = struct.unpack('>Q', header[8:16])[0]
+        elif size == 0:
+            return False
+        if size < 8:
+            return False
+        offset += size
+    return False
+
+def needs_finalize(path: str) -> bool:
+    """
+    Check if a file still needs the remux pass.
+    Returns False only for a .mp4 file with an MP4 ftyp brand whose
+    moov box comes before mdat and is not fragmented (no mvex), i.e.
+    already streamable. Reads box headers only.
+    """
+    if os.path.splitext(path)[1].lower() != '.mp4':
+        return True
+
+    try:
+        with open(path, 'rb') as f:
+            for box_type, offset, header_len, size in _top_level_boxes(f, os.fstat(f.fileno()).st_size):
+                if offset == 0:
+                    if box_type != b'ftyp':
+                        return True
+                    f.seek(header_len)
+                    if f.read(4) not in _MP4_BRANDS:
+                        return True
+                if box_type == b'moov':
+                    return _has_child_box(f, offset + header_len, offset + size, b'mvex')
+                if box_type == b'mdat' or size < 8:
+                    return True
+    except (OSError, struct.error):
+        pass
+
+    return True
+
 def finalize_video(input_path: str) -> Optional[str]:
     """
     Finalize video by remuxing with ffmpeg.
     Standardizes format to mp4 and fixes seeking/duration issues.
     MANDATORY STEP per instructions.
+    Already-streamable MP4s are returned as-is (no second ffmpeg pass).
 
     Command: ffmpeg -y -i INPUT -map 0 -c copy -movflags +faststart FINAL.mp4
     """
+    if not needs_finalize(input_path):
+        logger.info(f"⏩ Already faststart MP4, skipping finalization: {os.path.basename(input_path)}")
+        return input_path
+
+    _ensure_init()
+
     if not FFMPEG_AVAILABLE:
         logger.warning("⚠️ FFmpeg not available, skipping finalization")
         return None
@@ -117,334 +453,681 @@ def finalize_video(input_path: str) -> Optional[str]:
     dir_path = os.path.dirname(input_path)
     final_path = os.path.join(dir_path, f"FINAL_{name}.mp4")
 
-    try:
-        # 1. Primary Attempt: Standard Copy with Bitstream Filter
-        cmd = [
-            ffmpeg, '-y',
-            '-i', input_path,
-            '-map', '0',
-            '-c', 'copy',
-            '-bsf:a', 'aac_adtstoasc',
-            '-movflags', '+faststart',
-            final_path
-        ]
+    # Fallback output; renamed to final_path only if the fallback wins
+    alt_path = os.path.join(dir_path, f"FINAL_{name}.alt.mp4")
 
-        logger.info(f"🔄 Finalizing video (Attempt 1): {base_name}")
+    # 1. Primary Attempt: Standard Copy with Bitstream Filter
+    cmd = [
+        ffmpeg, '-y',
+        '-nostats', '-v', 'error',  # stderr: errors only, kept for the log
+        '-i', input_path,
+        '-map', '0',
+        '-c', 'copy',
+        '-bsf:a', 'aac_adtstoasc',
+        '-movflags', '+faststart',
+        '-threads', '1',        # Stream copy: nothing to parallelize
+        final_path
+    ]
 
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            timeout=1800,
-            env=os.environ.copy()
-        )
+    # 2. Fallback Attempt: Audio Transcode (Fixes codec issues causing segfaults)
+    cmd_fallback = [
+        ffmpeg, '-y',
+        '-nostats', '-v', 'error',
+        '-i', input_path,
+        '-map', '0',
+        '-c:v', 'copy',     # Copy video
+        '-c:a', 'aac',      # Re-encode audio to AAC
+        '-movflags', '+faststart',
+        '-threads', FFMPEG_THREADS_ARG,
+        alt_path
+    ]
 
-        if result.returncode == 0 and os.path.exists(final_path) and os.path.getsize(final_path) > 1024:
-             logger.info(f"✅ Finalization success (Mode 1)")
-             return final_path
+    # Both run at once so a failing primary costs max(t1, t2), not t1 + t2.
+    # The primary's output is still preferred whenever it succeeds. Running
+    # both needs room for two outputs of about the input's size; without
+    # it, the fallback only runs once the primary has failed.
+    try:
+        concurrent = shutil.disk_usage(dir_path or '.').free >= 2 * os.path.getsize(input_path)
+    except OSError:
+        concurrent = False
 
-        # 2. Fallback Attempt: Audio Transcode (Fixes codec issues causing segfaults)
-        logger.warning(f"⚠️ Finalization failed (RC: {result.returncode}). Retrying with audio transcode...")
+    procs = []
+    try:
+        with _FINALIZE_SLOTS:
+            logger.info(f"🔄 Finalizing video (Attempts 1{'+2' if concurrent else ''}): {base_name}")
+            deadline = time.monotonic() + 1800
 
-        cmd_fallback = [
-            ffmpeg, '-y',
-            '-i', input_path,
-            '-map', '0',
-            '-c:v', 'copy',     # Copy video
-            '-c:a', 'aac',      # Re-encode audio to AAC
-            '-movflags', '+faststart',
-            final_path
-        ]
+            primary, primary_tail = _spawn_stderr_tail(cmd)
+            procs.append(primary)
+            if concurrent:
+                fallback, fallback_tail = _spawn_stderr_tail(cmd_fallback)
+                procs.append(fallback)
 
-        result_fb = subprocess.run(
-            cmd_fallback,
-            capture_output=True,
-            timeout=1800,
-            env=os.environ.copy()
-        )
+            rc = _wait_quiet(primary, 1800)
+            if rc == 0 and _size_if_exists(final_path):
+                 logger.info(f"✅ Finalization success (Mode 1)")
+                 return final_path
+
+            logger.warning(f"⚠️ Finalization failed (RC: {rc}). Waiting for audio transcode...")
+            logger.debug(f"Attempt 1 stderr: {primary_tail()}")
+
+            if not concurrent:
+                # Free the failed copy's space before writing the fallback
+                _remove_quiet(final_path)
+                deadline = time.monotonic() + 1800
+                fallback, fallback_tail = _spawn_stderr_tail(cmd_fallback)
+                procs.append(fallback)
 
-        if result_fb.returncode == 0 and os.path.exists(final_path) and os.path.getsize(final_path) > 1024:
-             logger.info(f"✅ Finalization success (Mode 2 - Audio Transcode)")
-             return final_path
+            rc_fb = _wait_quiet(fallback, max(0.0, deadline - time.monotonic()))
+            if rc_fb == 0 and _size_if_exists(alt_path):
+                 os.replace(alt_path, final_path)
+                 logger.info(f"✅ Finalization success (Mode 2 - Audio Transcode)")
+                 return final_path
 
-        logger.error(f"❌ All finalization attempts failed. Last RC: {result_fb.returncode}")
+            logger.error(f"❌ All finalization attempts failed. Last RC: {rc_fb}")
+            logger.error(f"Attempt 2 stderr: {fallback_tail()}")
 
     except Exception as e:
         logger.error(f"❌ Finalization error: {e}")
 
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+        _remove_quiet(alt_path)
+
     return None
 
 def validate_video(filepath: str) -> bool:
     """
-    Strict validation of video file using ffprobe.
+    Strict validation of video file via the shared probe.
     Checks duration (must not be empty, 0, or NaN).
     """
-    if not FFPROBE_AVAILABLE:
+    probe = _probe_all(filepath)
+    if probe is None:
+        logger.warning(f"❌ Validation failed: Could not probe {os.path.basename(filepath)}")
         return False
 
-    ffprobe = get_ffprobe_path()
-
-    try:
-        cmd = [
-            ffprobe, '-v', 'error',
-            '-show_entries', 'format=duration',
-            '-of', 'default=noprint_wrappers=1:nokey=1',
-            filepath
-        ]
-
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=20,
-            env=os.environ.copy()
-        )
-
-        if result.returncode == 0:
-            output = result.stdout.strip()
-            if output == 'N/A' or not output:
-                logger.warning(f"❌ Validation failed: Duration is N/A or empty")
-                return False
-
-            try:
-                duration = float(output)
-                if duration <= 0 or duration != duration: # check for NaN
-                     logger.warning(f"❌ Validation failed: Duration {duration}")
-                     return False
-                return True
-            except ValueError:
-                logger.warning(f"❌ Validation failed: Could not parse duration '{output}'")
-                return False
-
-    except Exception as e:
-        logger.error(f"❌ Validation error: {e}")
-
-    return False
+    duration = probe['duration']
+    if duration <= 0:
+        logger.warning(f"❌ Validation failed: Duration is N/A or empty")
+        return False
+    return True
 
 def get_video_duration(filepath: str) -> int:
     """
-    Get video duration strictly using ffprobe.
+    Get video duration strictly from the shared probe.
     Returns 0 if failed/invalid (to trigger fallback upstream).
     """
-    if not os.path.exists(filepath):
-        return 0
-
-    if not FFPROBE_AVAILABLE:
-        return 0
-
-    ffprobe = get_ffprobe_path()
-    
-    try:
-        cmd = [
-            ffprobe, '-v', 'error',
-            '-show_entries', 'format=duration',
-            '-of', 'default=noprint_wrappers=1:nokey=1',
-            filepath
-        ]
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=20,
-            env=os.environ.copy()
-        )
-        
-        if result.returncode == 0 and result.stdout.strip():
-            duration_str = result.stdout.strip()
-            if duration_str and duration_str != 'N/A':
-                duration = float(duration_str)
-                if duration > 0 and duration == duration: # Check > 0 and not NaN
-                    return int(duration)
-    except Exception as e:
-        logger.debug(f"Duration check failed: {e}")
-    
-    return 0
+    probe = _probe_all(filepath)
+    return int(probe['duration']) if probe else 0
 
 def get_video_dimensions(filepath: str) -> Tuple[int, int]:
     """
     Get video width and height
     """
-    if not FFPROBE_AVAILABLE:
-        return 1280, 720
-    
-    ffprobe = get_ffprobe_path()
-    
+    probe = _probe_all(filepath)
+    if probe and probe['width'] > 0 and probe['height'] > 0:
+        # Ensure even dimensions for encoding compatibility (if needed later)
+        return probe['width'] & ~1, probe['height'] & ~1
+
+    return 1280, 720
+
+# Thumbnails are only taken from finalized MP4s, whose stream info is all
+# in moov - no need for libavformat's default 5MB/5s stream detection.
+# Not used for finalize/split: raw inputs (e.g. HLS .ts) need the full probe
+FAST_PROBE = ('-probesize', '32K', '-analyzeduration', '0')
+
+_THUMB_SCALE = f"scale={THUMB_WIDTH}:{THUMB_HEIGHT}:force_original_aspect_ratio=decrease"
+
+def _run_thumbnail(cmd: List[str], thumb_path: str, method: str) -> bool:
+    """Run one thumbnail command; True if it produced a usable JPEG"""
+    # ffmpeg can exit 0 without writing a frame (e.g. seeking past the end),
+    # so whatever is at thumb_path must come from this run
+    _remove_quiet(thumb_path)
     try:
-        cmd = [
-            ffprobe, '-v', 'error',
-            '-select_streams', 'v:0',
-            '-show_entries', 'stream=width,height',
-            '-of', 'csv=p=0',
-            filepath
-        ]
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=15,
-            env=os.environ.copy()
-        )
-        
-        if result.returncode == 0 and result.stdout.strip():
-            output = result.stdout.strip()
-            if ',' in output:
-                w, h = output.split(',')
-                width = int(w)
-                height = int(h)
-                
-                if width > 0 and height > 0:
-                    # Ensure even dimensions for encoding compatibility (if needed later)
-                    width = width - (width % 2) if width % 2 else width
-                    height = height - (height % 2) if height % 2 else height
-                    return width, height
+        result = _run_quiet(cmd, timeout=30)
+
+        if result.returncode == 0 and _size_if_exists(thumb_path):
+            logger.info(f"✅ Thumbnail generated ({method} Method)")
+            return True
     except Exception as e:
-        logger.debug(f"Dimensions extraction failed: {e}")
-    
-    return 1280, 720
+        logger.debug(f"{method} thumbnail method failed: {e}")
+
+    return False
 
 def generate_thumbnail(video_path: str, thumb_path: str, duration: int = 0) -> bool:
     """
     Generate thumbnail strictly from FINAL.mp4
+    Fast Method: nearest keyframe at 3s, decoded only, scaled in ffmpeg
     Primary Method: ffmpeg -y -ss 00:00:03 -i FINAL.mp4 -frames:v 1 thumb.jpg
     """
     if not os.path.exists(video_path):
         return False
     
+    _ensure_init()
+    
     if not FFMPEG_AVAILABLE:
         return False
     
     ffmpeg = get_ffmpeg_path()
     
+    # Method 0: keyframes only - no decoding of the frames in between,
+    # no audio/subtitle/data demux; GPU decode when available
+    cmd = [ffmpeg, '-y']
+    if HWACCEL:
+        cmd += ['-hwaccel', HWACCEL]
+    cmd += [
+        '-skip_frame', 'nokey',
+        '-ss', '00:00:03',
+        '-noaccurate_seek',
+        '-threads', FFMPEG_THREADS_ARG,  # Decoder threads
+        *FAST_PROBE,
+        '-i', video_path,
+        '-an', '-sn', '-dn',
+        '-vf', _THUMB_SCALE,
+        '-vsync', 'vfr',
+        '-frames:v', '1',
+        '-q:v', '2',
+        thumb_path
+    ]
+    if _run_thumbnail(cmd, thumb_path, "Keyframe"):
+        return True
+
     # Method 1: Mandatory Try (Strict Instruction)
     # ffmpeg -y -ss 00:00:03 -i FINAL.mp4 -frames:v 1 thumb.jpg
-    
-    try:
-        cmd = [
-            ffmpeg, '-y',
-            '-ss', '00:00:03',
-            '-i', video_path,
-            '-frames:v', '1',
-            '-q:v', '2',
-            thumb_path
-        ]
-
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            timeout=30,
-            env=os.environ.copy()
-        )
-
-        if result.returncode == 0 and os.path.exists(thumb_path):
-            size = os.path.getsize(thumb_path)
-            if size > 1024:
-                logger.info("✅ Thumbnail generated (Primary Method)")
-                return True
-    except Exception as e:
-        logger.debug(f"Primary thumbnail method failed: {e}")
+    cmd = [
+        ffmpeg, '-y',
+        '-ss', '00:00:03',
+        '-threads', FFMPEG_THREADS_ARG,  # Decoder threads
+        *FAST_PROBE,
+        '-i', video_path,
+        '-an', '-sn', '-dn',
+        '-frames:v', '1',
+        '-q:v', '2',
+        thumb_path
+    ]
+    if _run_thumbnail(cmd, thumb_path, "Primary"):
+        return True
 
     # Method 2: Fallback (Try without seek if seek failed, or at 0s)
-    try:
-        cmd = [
-            ffmpeg, '-y',
-            '-i', video_path,
-            '-frames:v', '1',
-            '-q:v', '2',
-            thumb_path
-        ]
-
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            timeout=30,
-            env=os.environ.copy()
-        )
-
-        if result.returncode == 0 and os.path.exists(thumb_path):
-            size = os.path.getsize(thumb_path)
-            if size > 1024:
-                logger.info("✅ Thumbnail generated (Fallback Method)")
-                return True
-    except Exception as e:
-        logger.debug(f"Fallback thumbnail method failed: {e}")
-
-    return False
+    # Full stream detection here, in case the input was not a clean MP4
+    cmd = [
+        ffmpeg, '-y',
+        '-threads', FFMPEG_THREADS_ARG,  # Decoder threads
+        '-i', video_path,
+        '-an', '-sn', '-dn',
+        '-frames:v', '1',
+        '-q:v', '2',
+        thumb_path
+    ]
+    return _run_thumbnail(cmd, thumb_path, "Fallback")
 
-def split_video_file(video_path: str, max_size_mb: int = 1900) -> List[str]:
+def plan_video_split(video_path: str, max_size_mb: int = 1900) -> Optional[Tuple[int, float]]:
     """
-    Split large video file using ffmpeg
+    Work out how to split a large video.
+    Returns (num_parts, part_duration), or None if no split is needed/possible.
     """
+    _ensure_init()
     if not FFMPEG_AVAILABLE:
-        return [video_path]
+        return None
     
     try:
         file_size = os.path.getsize(video_path)
         file_size_mb = file_size / (1024 * 1024)
         
         if file_size_mb <= max_size_mb:
-            return [video_path]
+            return None
         
-        duration = get_video_duration(video_path)
+        duration = get_video_metadata(video_path)['duration']
         if duration <= 0:
-            return [video_path]
+            return None
         
         max_size_bytes = max_size_mb * 1024 * 1024
         num_parts = int(file_size / max_size_bytes) + 1
-        split_duration = duration / num_parts
+        return num_parts, duration / num_parts
+        
+    except Exception:
+        return None
+
+def video_part_path(video_path: str, index: int, num_parts: int) -> str:
+    """Path of part `index` (0-based) of a split, next to the source"""
+    name, ext = os.path.splitext(os.path.basename(video_path))
+    return os.path.join(os.path.dirname(video_path), f"{name}_part{index+1:03d}_of_{num_parts:03d}{ext}")
+
+def extract_video_part(video_path: str, index: int, num_parts: int, part_duration: float) -> Optional[str]:
+    """
+    Cut part `index` (0-based) of a planned split with stream copy.
+    Returns part path, or None if ffmpeg failed.
+    """
+    part_path = video_part_path(video_path, index, num_parts)
+    
+    cmd = [
+        get_ffmpeg_path(), '-y',
+        '-ss', str(index * part_duration),
+        '-i', video_path,
+        '-t', str(part_duration),
+        '-c', 'copy',
+        '-avoid_negative_ts', 'make_zero',
+        '-threads', '1',        # Stream copy: nothing to parallelize
+        part_path
+    ]
+    
+    try:
+        result = _run_quiet(cmd, timeout=900)
         
-        base_name = os.path.basename(video_path)
-        name, ext = os.path.splitext(base_name)
-        dir_path = os.path.dirname(video_path)
+        if result.returncode == 0 and os.path.exists(part_path):
+            return part_path
+    except Exception as e:
+        logger.error(f"❌ Split part {index+1} error: {e}")
+    
+    return None
+
+class SegmentSplit:
+    """
+    Single-pass split with the segment muxer, read as it goes: ffmpeg
+    lists each segment on stdout once it has closed it, so a segment can
+    be used while the next one is still being written.
+    Segments are cut on keyframes. Callers move each segment they take
+    (e.g. to video_part_path); close() removes the rest.
+    """
+    
+    def __init__(self, video_path: str, part_duration: float, timeout: float = 1800):
+        name, ext = os.path.splitext(os.path.basename(video_path))
+        self.dir_path = os.path.dirname(video_path)
+        seg_prefix = os.path.join(self.dir_path, f"{name}_seg")
+        self._seg_glob = f"{glob.escape(seg_prefix)}[0-9][0-9][0-9]{ext}"
         
-        ffmpeg = get_ffmpeg_path()
-        parts = []
+        cmd = [
+            get_ffmpeg_path(), '-y',
+            '-i', video_path,
+            '-map', '0',
+            '-c', 'copy',
+            '-f', 'segment',
+            '-segment_time', str(part_duration),
+            '-segment_list', 'pipe:1',
+            '-segment_list_type', 'csv',   # filename,start,end per closed segment
+            '-reset_timestamps', '1',
+            '-avoid_negative_ts', 'make_zero',
+            '-segment_start_number', '1',
+            '-threads', '1',        # Stream copy: nothing to parallelize
+            f"{seg_prefix}%03d{ext}"
+        ]
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, **_SPAWN_KWARGS)
         
-        for i in range(num_parts):
-            start_pos = i * split_duration
-            part_name = f"{name}_part{i+1:03d}_of_{num_parts:03d}{ext}"
-            part_path = os.path.join(dir_path, part_name)
-            
-            cmd = [
-                ffmpeg, '-y',
-                '-ss', str(start_pos),
-                '-i', video_path,
-                '-t', str(split_duration),
-                '-c', 'copy',
-                '-avoid_negative_ts', 'make_zero',
-                part_path
-            ]
-            
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                timeout=900,
-                env=os.environ.copy()
-            )
-            
-            if result.returncode == 0 and os.path.exists(part_path):
-                parts.append(part_path)
-            else:
-                return [video_path] # Fallback to original if split fails
+        # Watchdog for a hung ffmpeg (reads then hit EOF); time spent
+        # paused does not count
+        self._remaining = timeout
+        self._paused = False
+        self._arm()
+    
+    def _arm(self):
+        self._deadline = time.monotonic() + self._remaining
+        self._watchdog = threading.Timer(self._remaining, self.proc.kill)
+        self._watchdog.daemon = True
+        self._watchdog.start()
+    
+    def _disarm(self):
+        self._watchdog.cancel()
+        self._remaining = max(0.0, self._deadline - time.monotonic())
+    
+    def next_segment(self) -> Optional[Tuple[str, float]]:
+        """
+        Block until ffmpeg closes the next segment and return (path, start
+        seconds), or None once all segments are out. Raises RuntimeError
+        if ffmpeg failed.
+        """
+        line = self.proc.stdout.readline()
+        if line:
+            filename, start, _ = next(csv.reader([line.decode(errors='replace').strip()]))
+            return os.path.join(self.dir_path, filename), float(start)
         
-        if len(parts) >= 2:
-            try:
-                os.remove(video_path)
-            except:
-                pass
+        rc = self.proc.wait()
+        self._watchdog.cancel()
+        if rc != 0:
+            raise RuntimeError(f"segment split exited with {rc}")
+        return None
+    
+    def pause(self):
+        """Stop ffmpeg (SIGSTOP) so no further segments pile up on disk"""
+        if not self._paused and self.proc.poll() is None:
+            self._disarm()
+            os.kill(self.proc.pid, signal.SIGSTOP)
+            self._paused = True
+    
+    def resume(self):
+        """Let a paused ffmpeg continue"""
+        if self._paused:
+            self._paused = False
+            if self.proc.poll() is None:
+                os.kill(self.proc.pid, signal.SIGCONT)
+                self._arm()
+    
+    def close(self):
+        """Stop ffmpeg if still running and remove the segments not taken"""
+        self._watchdog.cancel()
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        self.proc.stdout.close()
+        for path in glob.glob(self._seg_glob):
+            _remove_quiet(path)
+
+def split_video_segments(video_path: str, part_duration: float, max_size_mb: int) -> Optional[List[str]]:
+    """
+    Split in a single ffmpeg pass with the segment muxer.
+    Segments are cut on keyframes, so any part over max_size_mb
+    rejects the whole result. Returns None on failure.
+    """
+    segments = []
+    parts = []
+    split = SegmentSplit(video_path, part_duration)
+    try:
+        segment = split.next_segment()
+        while segment:
+            segments.append(segment[0])
+            segment = split.next_segment()
         
-        return parts if parts else [video_path]
+        max_bytes = max_size_mb * 1024 * 1024
+        if len(segments) >= 2 and all(os.path.getsize(seg) <= max_bytes for seg in segments):
+            for i, seg in enumerate(segments):
+                part_path = video_part_path(video_path, i, len(segments))
+                os.replace(seg, part_path)
+                parts.append(part_path)
+            return parts
         
-    except Exception:
-        return [video_path]
+        logger.warning(f"⚠️ Segment split unusable ({len(segments)} segments), falling back to per-part cuts")
+    except Exception as e:
+        logger.warning(f"⚠️ Segment split error: {e}")
+    finally:
+        # After a timeout or error, ffmpeg may have left unlisted segments behind
+        split.close()
+    
+    for path in parts:
+        _remove_quiet(path)
+    
+    return None
 
-def get_video_metadata(filepath: str) -> dict:
+def split_video_file(video_path: str, max_size_mb: int = 1900) -> List[str]:
     """
-    Get complete video metadata
+    Split large video file using ffmpeg
     """
-    duration = get_video_duration(filepath)
-    width, height = get_video_dimensions(filepath)
+    plan = plan_video_split(video_path, max_size_mb)
+    if not plan:
+        return [video_path]
+    
+    num_parts, part_duration = plan
+    
+    parts = split_video_segments(video_path, part_duration, max_size_mb)
+    if parts:
+        try:
+            os.remove(video_path)
+        except OSError:
+            pass
+        return parts
     
+    # Fallback: stream-copy cuts are I/O bound, so the parts are cut concurrently.
+    # Own pool: this usually runs inside FFMPEG_EXECUTOR already.
+    workers = max(1, min(num_parts, MAX_SPLIT_WORKERS))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(
+            lambda i: extract_video_part(video_path, i, num_parts, part_duration),
+            range(num_parts)
+        ))
+    
+    if not all(parts):
+        return [video_path] # Fallback to original if split fails
+    
+    if len(parts) >= 2:
+        try:
+            os.remove(video_path)
+        except:
+            pass
+    
+    return parts
+
+def _parse_duration(value) -> float:
+    """ffprobe duration string -> seconds (0.0 if missing, N/A or NaN)"""
+    try:
+        duration = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return duration if duration > 0 and duration == duration else 0.0
+
+# Larger moov boxes (very long recordings) are left to ffprobe
+_MOOV_MAX_BYTES = 64 * 1024 * 1024
+
+def _video_track_size(moov: bytes, start: int, end: int) -> Tuple[int, int]:
+    """tkhd width/height of a trak box if its handler is 'vide', else (0, 0)"""
+    tkhd = None
+    is_video = False
+    for box_type, box_start, box_end in _child_boxes(moov, start, end):
+        if box_type == b'tkhd':
+            tkhd = box_start
+        elif box_type == b'mdia':
+            for sub_type, sub_start, _ in _child_boxes(moov, box_start, box_end):
+                if sub_type == b'hdlr':
+                    is_video = moov[sub_start + 8:sub_start + 12] == b'vide'
+
+    if not is_video or tkhd is None:
+        return 0, 0
+
+    # 16.16 fixed point, after the version-dependent time fields and matrix
+    width, height = struct.unpack_from('>II', moov, tkhd + (88 if moov[tkhd] == 1 else 76))
+    return width >> 16, height >> 16
+
+def _parse_mp4_metadata(filepath: str) -> Optional[dict]:
+    """
+    Duration and video size straight from the MP4 moov box (mvhd/tkhd),
+    without spawning ffprobe. None if the file is not ISOBMFF, has no
+    usable moov, or reports no duration (e.g. fragmented MP4).
+    """
+    try:
+        with open(filepath, 'rb') as f:
+            moov = None
+            for box_type, offset, header_len, size in _top_level_boxes(f, os.fstat(f.fileno()).st_size):
+                if offset == 0 and box_type != b'ftyp':
+                    return None
+                if box_type == b'moov':
+                    if size > _MOOV_MAX_BYTES:
+                        return None
+                    f.seek(offset + header_len)
+                    moov = f.read(size - header_len)
+                    break
+        if not moov:
+            return None
+
+        duration = 0.0
+        width = height = 0
+        for box_type, start, end in _child_boxes(moov, 0, len(moov)):
+            if box_type == b'mvhd':
+                if moov[start] == 1:
+                    timescale, units = struct.unpack_from('>IQ', moov, start + 20)
+                    unknown = units == 0xFFFFFFFFFFFFFFFF
+                else:
+                    timescale, units = struct.unpack_from('>II', moov, start + 12)
+                    unknown = units == 0xFFFFFFFF
+                if timescale and not unknown:
+                    duration = units / timescale
+            elif box_type == b'trak' and not width:
+                width, height = _video_track_size(moov, start, end)
+    except (OSError, struct.error, IndexError):
+        return None
+
+    if duration <= 0:
+        return None
+
     return {
-        'duration': duration,
+        'duration': _parse_duration(duration),
         'width': width,
-        'height': height
+        'height': height,
+        'format': 'mov,mp4,m4a,3gp,3g2,mj2',
+    }
+
+def _probe_duration_ffmpeg(filepath: str) -> float:
+    """Fallback: read the Duration line that ffmpeg -i prints to stderr"""
+    _ensure_init()
+    if not FFMPEG_AVAILABLE:
+        return 0.0
+
+    result = subprocess.run(
+        [get_ffmpeg_path(), '-hide_banner', '-i', filepath],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        timeout=20,
+        **_SPAWN_KWARGS
+    )
+    match = _DURATION_RE.search(result.stderr)
+    if not match:
+        return 0.0
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+# Headers sit in the first few hundred KB of a finalized MP4
+_PROBE_ARGS = ('-v', 'quiet', '-analyzeduration', '1000000', '-probesize', '1000000')
+
+def _run_ffprobe(args: List[str], filepath: str) -> bytes:
+    """Raw ffprobe stdout for filepath; raises on a non-zero exit"""
+    result = subprocess.run(
+        [get_ffprobe_path(), *_PROBE_ARGS, *args, filepath],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        timeout=20,
+        **_SPAWN_KWARGS
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe exited with {result.returncode}")
+    return result.stdout
+
+def _probe_json(filepath: str) -> dict:
+    """Full JSON probe - fallback when the compact output is unusable"""
+    output = _run_ffprobe(['-print_format', 'json', '-show_format', '-show_streams'], filepath)
+
+    try:
+        data = json.loads(output)
+    except ValueError:
+        duration = _probe_duration_ffmpeg(filepath)
+        if duration <= 0:
+            raise
+        return {'duration': duration, 'width': 0, 'height': 0, 'format': ''}
+
+    fmt = data.get('format') or {}
+    video = next(
+        (s for s in data.get('streams') or [] if s.get('codec_type') == 'video'),
+        {}
+    )
+    return {
+        'duration': _parse_duration(fmt.get('duration')),
+        'width': int(video.get('width') or 0),
+        'height': int(video.get('height') or 0),
+        'format': fmt.get('format_name', ''),
     }
+
+def _probe_pyav(filepath: str) -> Optional[dict]:
+    """Header probe through libavformat in this process (None if unusable)"""
+    try:
+        with av.open(filepath, metadata_errors='ignore') as container:
+            video = next(iter(container.streams.video), None)
+            duration = container.duration / av.time_base if container.duration else 0
+            probe = {
+                'duration': _parse_duration(duration),
+                'width': video.codec_context.width if video else 0,
+                'height': video.codec_context.height if video else 0,
+                'format': container.format.name,
+            }
+    except Exception as e:
+        logger.debug(f"PyAV probe failed for {filepath}: {e}")
+        return None
+
+    return probe if probe['duration'] > 0 else None
+
+def _probe_file(filepath: str) -> dict:
+    """
+    One probe for everything we need about a file: moov parse, then
+    PyAV, then ffprobe. Raises on failure (callers don't cache errors).
+    """
+    probe = _parse_mp4_metadata(filepath)
+    if probe:
+        return probe
+
+    if av is not None:
+        probe = _probe_pyav(filepath)
+        if probe:
+            return probe
+
+    # Only this last step needs ffprobe
+    if not FFPROBE_AVAILABLE:
+        raise RuntimeError("ffprobe not available")
+
+    # key=value lines; stream entries carry no duration, so keys are unique.
+    # Parsed as bytes: float()/int() take them directly, no decode needed
+    output = _run_ffprobe([
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height:format=duration,format_name',
+        '-of', 'default=nw=1',
+    ], filepath)
+    fields = dict(line.partition(b'=')[::2] for line in output.splitlines())
+
+    if b'duration' not in fields:
+        return _probe_json(filepath)
+
+    width, height = fields.get(b'width', b''), fields.get(b'height', b'')
+    return {
+        'duration': _parse_duration(fields[b'duration']),
+        'width': int(width) if width.isdigit() else 0,
+        'height': int(height) if height.isdigit() else 0,
+        'format': fields.get(b'format_name', b'').decode('ascii', 'replace'),
+    }
+
+# (st_dev, st_ino, st_mtime_ns, st_size) -> probe, least recently used first.
+# Integer keys: cheap to hash, survive renames, change when the file does
+_PROBE_CACHE = OrderedDict()
+_PROBE_CACHE_MAX = 256
+_PROBE_CACHE_LOCK = threading.Lock()
+
+def _probe_all(filepath: str) -> Optional[dict]:
+    """
+    Cached probe result for filepath (duration in float seconds, raw
+    width/height, container format), or None if it can't be probed.
+    """
+    _ensure_init()
+
+    try:
+        st = os.stat(filepath)
+        key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+        with _PROBE_CACHE_LOCK:
+            probe = _PROBE_CACHE.get(key)
+            if probe is not None:
+                _PROBE_CACHE.move_to_end(key)
+                return probe
+
+        probe = _probe_file(filepath)
+    except Exception as e:
+        logger.debug(f"Probe failed for {filepath}: {e}")
+        return None
+
+    with _PROBE_CACHE_LOCK:
+        _PROBE_CACHE[key] = probe
+        if len(_PROBE_CACHE) > _PROBE_CACHE_MAX:
+            _PROBE_CACHE.popitem(last=False)
+    return probe
+
+def get_video_metadata(filepath: str) -> dict:
+    """
+    Get complete video metadata (duration, width, height) from one probe.
+    Results are cached per path while the file is unchanged.
+    """
+    metadata = {'duration': 0, 'width': 1280, 'height': 720}
+
+    probe = _probe_all(filepath)
+    if probe is None:
+        return metadata
+
+    metadata['duration'] = int(probe['duration'])
+    if probe['width'] > 0 and probe['height'] > 0:
+        # Ensure even dimensions for encoding compatibility (if needed later)
+        metadata['width'] = probe['width'] & ~1
+        metadata['height'] = probe['height'] & ~1
+
+    return metadata